@@ -0,0 +1,159 @@
+"""
+Load test for the Dialogflow webhook.
+
+Replays many concurrent multi-turn conversations (start, add, remove, complete,
+tracking polls, ...) and reports latency percentiles and throughput per intent.
+
+In-process, against main.app on an SQLite copy of db/pandeyji_eatery.sql:
+
+    python -m benchmark.loadtest --sessions 2000 --concurrency 200
+
+Against a running server (e.g. one started with `python -m benchmark.serve`):
+
+    python -m benchmark.loadtest --url http://localhost:8000
+
+--max-p99-ms makes the run fail when any intent is slower, for use in CI.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmark import payloads
+
+
+def percentile(sorted_values: list, pct: float):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Results:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, intent: str, seconds: float, ok: bool):
+        self.latencies[intent].append(seconds)
+        if not ok:
+            self.errors[intent] += 1
+
+    def summary(self, elapsed: float):
+        rows = []
+        all_latencies = []
+        for intent in sorted(self.latencies):
+            values = sorted(self.latencies[intent])
+            all_latencies.extend(values)
+            rows.append(self._row(intent, values, self.errors[intent], elapsed))
+        rows.append(self._row("TOTAL", sorted(all_latencies), sum(self.errors.values()), elapsed))
+        return rows
+
+    @staticmethod
+    def _row(intent: str, values: list, errors: int, elapsed: float):
+        return {
+            "intent": intent,
+            "requests": len(values),
+            "errors": errors,
+            "rps": len(values) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+        }
+
+
+async def run_conversation(client: httpx.AsyncClient, rng: random.Random, results: Results):
+    conversation = payloads.conversation(rng)
+    reply = None
+    try:
+        intent, request = next(conversation)
+        while True:
+            started = time.perf_counter()
+            try:
+                response = await client.post("/", json=request)
+                ok = response.status_code == 200
+                reply = response.json().get("fulfillmentText", "") if ok else None
+            except httpx.HTTPError:
+                ok, reply = False, None
+            results.record(intent, time.perf_counter() - started, ok)
+            intent, request = conversation.send(reply)
+    except StopIteration:
+        pass
+
+
+async def run(client: httpx.AsyncClient, sessions: int, concurrency: int, seed: int):
+    results = Results()
+    semaphore = asyncio.Semaphore(concurrency)
+    rng = random.Random(seed)
+
+    async def one_session(session_seed):
+        async with semaphore:
+            await run_conversation(client, random.Random(session_seed), results)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_session(rng.random()) for _ in range(sessions)))
+    return results, time.perf_counter() - started
+
+
+async def run_in_process(args):
+    from benchmark import sqlite_backend
+    import main
+
+    sqlite_backend.install(args.sqlite_path, max_size=args.pool_size)
+    await main.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await run(client, args.sessions, args.concurrency, args.seed)
+    finally:
+        await main.app.router.shutdown()
+
+
+async def run_against_server(args):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        return await run(client, args.sessions, args.concurrency, args.seed)
+
+
+def print_table(rows: list):
+    print(f"{'intent':<12} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for row in rows:
+        print(f"{row['intent']:<12} {row['requests']:>9} {row['errors']:>7} {row['rps']:>9.1f} "
+              f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running server; omit to test main.app in-process")
+    parser.add_argument("--sessions", type=int, default=1000, help="number of conversations to replay")
+    parser.add_argument("--concurrency", type=int, default=100, help="conversations in flight at once")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--pool-size", type=int, default=10, help="DB pool size for in-process runs")
+    parser.add_argument("--sqlite-path", help="SQLite file for in-process runs (default: a temp file)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--max-p99-ms", type=float, help="exit non-zero if any intent's p99 is above this")
+    args = parser.parse_args(argv)
+
+    runner = run_against_server if args.url else run_in_process
+    results, elapsed = asyncio.run(runner(args))
+    rows = results.summary(elapsed)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_table(rows)
+
+    failed = any(row["errors"] for row in rows)
+    if args.max_p99_ms is not None:
+        failed = failed or any(row["p99_ms"] > args.max_p99_ms for row in rows)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
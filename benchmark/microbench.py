@@ -0,0 +1,115 @@
+"""
+Per-request CPU cost of webhook parsing and dispatch, before and after the fast path.
+
+Only the work done before a handler touches the database is measured: JSON
+decoding, logging, session/context extraction, dispatch and quantity parsing.
+
+    python -m benchmark.microbench [iterations]
+"""
+
+import json
+import os
+import re
+import sys
+import timeit
+from contextlib import redirect_stdout
+
+import generic_helper
+import main
+
+
+def make_payload(intent="Order.add - context: ongoing-order"):
+    # Shaped like a real Dialogflow ES webhook request, including the fields we ignore
+    session = "projects/pandeyji-eatery-abcd/agent/sessions/b6f2b7b5-76ee-5947-d9fd-c75e314c2b2f"
+    return json.dumps({
+        "responseId": "3d6ba9ad-5e65-4b1c-9a85-9a6c5c7e2f3e-0f0e27e1",
+        "queryResult": {
+            "queryText": "2 samosas and one mango lassi please",
+            "parameters": {"food-item": ["Samosa", "Mango Lassi"], "number": [2], "number1": [1]},
+            "allRequiredParamsPresent": True,
+            "fulfillmentText": "Ok, anything else?",
+            "fulfillmentMessages": [{"text": {"text": ["Ok, anything else?"]}}],
+            "outputContexts": [
+                {"name": f"{session}/contexts/ongoing-order", "lifespanCount": 5,
+                 "parameters": {"food-item": ["Samosa", "Mango Lassi"], "food-item.original": ["samosas", "mango lassi"],
+                                "number": [2], "number.original": ["2"], "number1": [1], "number1.original": ["one"]}},
+                {"name": f"{session}/contexts/__system_counters__",
+                 "parameters": {"no-input": 0, "no-match": 0}},
+            ],
+            "intent": {"name": "projects/pandeyji-eatery-abcd/agent/intents/0a1b2c3d", "displayName": intent},
+            "intentDetectionConfidence": 1,
+            "languageCode": "en",
+        },
+        "originalDetectIntentRequest": {"source": "telegram", "payload": {"data": {"chat": {"id": 123456789}}}},
+        "session": session,
+    }).encode()
+
+
+def legacy_request(body: bytes):
+    # The pipeline as it was before: full decode, payload dump, per-request dispatch table
+    payload = json.loads(body)
+    print("Payload:", payload)
+
+    intent = payload['queryResult']['intent']['displayName']
+    parameters = payload['queryResult']['parameters']
+    output_contexts = payload['queryResult'].get('outputContexts', [])
+    match = re.search(r"/sessions/([^/]+)/contexts/", output_contexts[0]['name'])
+    session_id = match.group(1) if match else ""
+
+    context_names = [ctx['name'].split('/')[-1] for ctx in output_contexts]
+    is_new_order = 'new-order-context' in context_names
+
+    intent_handler_dict = {
+        'User.ThankYou': main.thank_you_response,
+        'Shop.Hours': main.shop_hours,
+        'Order.Start': main.start_new_order,
+        'Order.add - context: ongoing-order': lambda p, s: (p, s, is_new_order),
+        'Order.Remove - context: ongoing-order': main.remove_from_order,
+        'Order.Complete - context: Ongoing-order': main.complete_order,
+        'tracking.order - context: ongoing-tracking': lambda p, s: main.track_order(p)
+    }
+    intent_handler_dict[intent](parameters, session_id)
+
+    quantity_keys = sorted(
+        [key for key in parameters.keys() if re.match(r'^number\d*$', key)],
+        key=lambda k: int(re.search(r'\d*$', k).group() or 0),
+        reverse=True
+    )
+    quantities = []
+    for key in quantity_keys:
+        quantities.extend(parameters.get(key, []))
+    return quantities
+
+
+def fast_request(body: bytes):
+    response_id, intent, parameters, output_contexts = main.parse_webhook(body)
+    main.INTENT_HANDLERS.get(intent)
+    generic_helper.extract_session_id(output_contexts[0]['name'])
+    generic_helper.has_context(output_contexts, 'new-order-context')
+    return main.get_quantities(parameters)
+
+
+def bench(func, body: bytes, iterations: int):
+    # Best of 5 runs, in microseconds per request
+    timings = timeit.repeat(lambda: func(body), number=iterations, repeat=5)
+    return min(timings) / iterations * 1e6
+
+
+def main_cli():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    body = make_payload()
+
+    # The old print() still pays for formatting the payload, only the terminal write is dropped
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        assert legacy_request(body) == fast_request(body)
+        before = bench(legacy_request, body, iterations)
+    after = bench(fast_request, body, iterations)
+
+    print(f"json decoder: {generic_helper.json_loads.__module__}")
+    print(f"before: {before:8.2f} us/request")
+    print(f"after:  {after:8.2f} us/request")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,105 @@
+"""
+Generates Dialogflow ES webhook requests for every intent in main.INTENT_HANDLERS.
+"""
+
+import random
+import uuid
+
+PROJECT = "pandeyji-eatery-bench"
+
+MENU_ITEMS = [
+    "Pav Bhaji", "Chole Bhature", "Pizza", "Mango Lassi", "Masala Dosa",
+    "Vegetable Biryani", "Vada Pav", "Rava Dosa", "Samosa",
+]
+
+# How customers actually type items, including a few the menu doesn't have
+SPOKEN_ITEMS = MENU_ITEMS + ["samosas", "mango lassi", "biryani", "pizzas", "Burger"]
+
+INTENTS = {
+    "thank_you": "User.ThankYou",
+    "shop_hours": "Shop.Hours",
+    "start": "Order.Start",
+    "add": "Order.add - context: ongoing-order",
+    "remove": "Order.Remove - context: ongoing-order",
+    "complete": "Order.Complete - context: Ongoing-order",
+    "track": "tracking.order - context: ongoing-tracking",
+}
+
+
+def make_request(intent: str, session_id: str, parameters: dict = None, contexts=("ongoing-order",)):
+    session = f"projects/{PROJECT}/agent/sessions/{session_id}"
+    parameters = parameters or {}
+    return {
+        "responseId": str(uuid.uuid4()),
+        "queryResult": {
+            "queryText": intent,
+            "parameters": parameters,
+            "allRequiredParamsPresent": True,
+            "outputContexts": [
+                {"name": f"{session}/contexts/{context}", "lifespanCount": 5, "parameters": parameters}
+                for context in contexts
+            ],
+            "intent": {"name": f"projects/{PROJECT}/agent/intents/{uuid.uuid4()}", "displayName": intent},
+            "intentDetectionConfidence": 1,
+            "languageCode": "en",
+        },
+        "originalDetectIntentRequest": {"source": "telegram", "payload": {}},
+        "session": session,
+    }
+
+
+def add_items_request(session_id: str, rng: random.Random, new_order: bool = False):
+    items = rng.sample(SPOKEN_ITEMS, rng.randint(1, 3))
+    quantities = [rng.randint(1, 4) for _ in items]
+
+    if len(items) > 1 and rng.random() < 0.5:
+        # Dialogflow sometimes puts the first quantity in number1, which main reads first
+        parameters = {"food-item": items, "number1": quantities[:1], "number": quantities[1:]}
+    else:
+        parameters = {"food-item": items, "number": quantities}
+
+    contexts = ("ongoing-order", "new-order-context") if new_order else ("ongoing-order",)
+    return make_request(INTENTS["add"], session_id, parameters, contexts), items
+
+
+def conversation(rng: random.Random, session_id: str = None):
+    """
+    Yields (intent key, request) for one customer's multi-turn conversation.
+    The caller sends the generator the webhook's reply text after each request,
+    which is how completed order IDs reach the tracking polls.
+    """
+    session_id = session_id or str(uuid.uuid4())
+    ordered = []
+
+    yield "start", make_request(INTENTS["start"], session_id)
+
+    for turn in range(rng.randint(1, 3)):
+        request, items = add_items_request(session_id, rng, new_order=turn == 0)
+        ordered.extend(items)
+        yield "add", request
+
+    if ordered and rng.random() < 0.3:
+        parameters = {"food-item": [rng.choice(ordered)]}
+        yield "remove", make_request(INTENTS["remove"], session_id, parameters)
+
+    reply = yield "complete", make_request(INTENTS["complete"], session_id)
+    order_id = parse_order_id(reply)
+
+    if rng.random() < 0.3:
+        yield "thank_you", make_request(INTENTS["thank_you"], session_id, contexts=())
+
+    # People poll their order several times, sometimes with a mistyped ID
+    for _ in range(rng.randint(0, 5)):
+        poll_id = order_id if order_id and rng.random() < 0.9 else rng.randint(1, 10 ** 6)
+        parameters = {"order_id": [poll_id]}
+        yield "track", make_request(INTENTS["track"], session_id, parameters, ("ongoing-tracking",))
+
+    if rng.random() < 0.2:
+        yield "shop_hours", make_request(INTENTS["shop_hours"], session_id, contexts=())
+
+
+def parse_order_id(reply: str):
+    if not reply or "#" not in reply:
+        return None
+    digits = reply.split("#", 1)[1].split(".", 1)[0]
+    return int(digits) if digits.isdigit() else None
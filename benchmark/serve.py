@@ -0,0 +1,29 @@
+"""
+Runs main.app under uvicorn on an SQLite copy of db/pandeyji_eatery.sql,
+so benchmark.loadtest --url can be pointed at a real server without MySQL.
+
+    python -m benchmark.serve [--port 8000]
+"""
+
+import argparse
+
+import uvicorn
+
+from benchmark import sqlite_backend
+import main
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--sqlite-path", help="SQLite file to use (default: a fresh temp file)")
+    args = parser.parse_args(argv)
+
+    sqlite_backend.install(args.sqlite_path, max_size=args.pool_size)
+    uvicorn.run(main.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,164 @@
+"""
+SQLite stand-in for MySQL, so the webhook can be benchmarked offline.
+
+The schema and seed data come from db/pandeyji_eatery.sql. Connections mimic
+the parts of mysql.connector that db_helper uses and translate the few
+MySQL-only constructs in its queries, so the real db_helper code (pool, caches,
+ID allocator) runs unchanged on top of it.
+"""
+
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from datetime import date
+from decimal import Decimal
+
+import mysql.connector
+
+import db_helper
+
+SQL_DUMP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "db", "pandeyji_eatery.sql")
+
+# (MySQL pattern, SQLite replacement) applied to every query
+QUERY_REWRITES = [
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"\bINSERT IGNORE\b", re.I), "INSERT OR IGNORE"),
+    (re.compile(r"\bGREATEST\(", re.I), "MAX("),
+    (re.compile(r"\bON DUPLICATE KEY UPDATE\b", re.I), "ON CONFLICT DO UPDATE SET"),
+    (re.compile(r"\bVALUES\((\w+)\)", re.I), r"excluded.\1"),
+    # BEGIN IMMEDIATE already locks the whole database
+    (re.compile(r"\s+FOR UPDATE( SKIP LOCKED)?\b", re.I), ""),
+]
+
+# mysql.connector accepts Decimal parameters (prices from the menu), sqlite3 doesn't
+sqlite3.register_adapter(Decimal, float)
+# Sales rollup days, sqlite3's own date adapter is deprecated
+sqlite3.register_adapter(date, date.isoformat)
+
+_CREATE_TABLE_RE = re.compile(r"CREATE TABLE `(\w+)` \((.*?)\n\)[^;]*;", re.S)
+_INSERT_RE = re.compile(r"^INSERT INTO `\w+` VALUES .*?;\s*$", re.M)
+
+
+def translate_query(query: str):
+    for pattern, replacement in QUERY_REWRITES:
+        query = pattern.sub(replacement, query)
+    return query
+
+
+def load_dump(cnx: sqlite3.Connection, path: str = SQL_DUMP):
+    with open(path, encoding="utf-8") as f:
+        dump = f.read()
+
+    for table, body in _CREATE_TABLE_RE.findall(dump):
+        # Indexes and foreign keys aren't needed for the benchmark
+        columns = [line.strip().rstrip(",") for line in body.strip().splitlines()]
+        columns = [col for col in columns if not col.startswith(("KEY ", "CONSTRAINT "))]
+        cnx.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)})")
+
+    for statement in _INSERT_RE.findall(dump):
+        cnx.execute(statement.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1))
+
+    cnx.commit()
+
+
+class SQLiteCursor:
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = connection.raw.cursor()
+        self.lastrowid = None
+
+    def execute(self, query: str, params=()):
+        try:
+            self._cursor.execute(translate_query(query), params)
+        except sqlite3.Error as err:
+            raise mysql.connector.DatabaseError(msg=str(err))
+        # UPDATE ... LAST_INSERT_ID(expr) stores its value on the connection
+        self.lastrowid = self._connection.last_insert_id or self._cursor.lastrowid
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    def __init__(self, path: str):
+        self.raw = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.raw.execute("PRAGMA journal_mode=WAL")
+        self.raw.execute("PRAGMA synchronous=NORMAL")
+        self.last_insert_id = None
+        self.raw.create_function("LAST_INSERT_ID", 1, self._set_last_insert_id)
+
+    def _set_last_insert_id(self, value):
+        self.last_insert_id = value
+        return value
+
+    def cursor(self):
+        self.last_insert_id = None
+        return SQLiteCursor(self)
+
+    def start_transaction(self):
+        self.raw.execute("BEGIN IMMEDIATE")
+
+    @property
+    def in_transaction(self):
+        return self.raw.in_transaction
+
+    def commit(self):
+        if self.raw.in_transaction:
+            self.raw.execute("COMMIT")
+
+    def rollback(self):
+        if self.raw.in_transaction:
+            self.raw.execute("ROLLBACK")
+
+    def is_connected(self):
+        return True
+
+    def ping(self, **kwargs):
+        pass
+
+    def close(self):
+        self.raw.close()
+
+
+_db_path = None
+_db_lock = threading.Lock()
+
+
+def create_database(path: str = None):
+    global _db_path
+
+    with _db_lock:
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="pandeyji_eatery_", suffix=".sqlite3")
+            os.close(fd)
+        cnx = sqlite3.connect(path)
+        load_dump(cnx)
+        cnx.close()
+        _db_path = path
+
+    return path
+
+
+def connect(**kwargs):
+    return SQLiteConnection(_db_path)
+
+
+def install(path: str = None, min_size: int = db_helper.POOL_MIN_SIZE, max_size: int = db_helper.POOL_MAX_SIZE):
+    # Must run before the app's startup hook, whose init_pool() then keeps this pool
+    create_database(path)
+    return db_helper.init_pool(min_size, max_size, connect=connect)
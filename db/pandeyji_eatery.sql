@@ -94,6 +94,107 @@ INSERT INTO `orders` VALUES (40,1,2,12.00),(40,3,1,8.00),(41,4,3,15.00),(41,6,2,
 /*!40000 ALTER TABLE `orders` ENABLE KEYS */;
 UNLOCK TABLES;
 
+--
+-- Table structure for table `order_id_sequence`
+--
+
+DROP TABLE IF EXISTS `order_id_sequence`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `order_id_sequence` (
+  `name` varchar(64) NOT NULL,
+  `next_value` int NOT NULL,
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `order_id_sequence`
+--
+
+LOCK TABLES `order_id_sequence` WRITE;
+/*!40000 ALTER TABLE `order_id_sequence` DISABLE KEYS */;
+INSERT INTO `order_id_sequence` VALUES ('orders',42);
+/*!40000 ALTER TABLE `order_id_sequence` ENABLE KEYS */;
+UNLOCK TABLES;
+
+--
+-- Table structure for table `sales_daily`
+--
+
+DROP TABLE IF EXISTS `sales_daily`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `sales_daily` (
+  `sale_date` date NOT NULL,
+  `order_count` int NOT NULL,
+  `item_count` int NOT NULL,
+  `revenue` decimal(12,2) NOT NULL,
+  PRIMARY KEY (`sale_date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `sales_daily`
+--
+
+LOCK TABLES `sales_daily` WRITE;
+/*!40000 ALTER TABLE `sales_daily` DISABLE KEYS */;
+/*!40000 ALTER TABLE `sales_daily` ENABLE KEYS */;
+UNLOCK TABLES;
+
+--
+-- Table structure for table `sales_daily_item`
+--
+
+DROP TABLE IF EXISTS `sales_daily_item`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `sales_daily_item` (
+  `sale_date` date NOT NULL,
+  `item_id` int NOT NULL,
+  `order_count` int NOT NULL,
+  `quantity` int NOT NULL,
+  `revenue` decimal(12,2) NOT NULL,
+  PRIMARY KEY (`sale_date`,`item_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `sales_daily_item`
+--
+
+LOCK TABLES `sales_daily_item` WRITE;
+/*!40000 ALTER TABLE `sales_daily_item` DISABLE KEYS */;
+/*!40000 ALTER TABLE `sales_daily_item` ENABLE KEYS */;
+UNLOCK TABLES;
+
+--
+-- Table structure for table `sales_pending`
+--
+
+DROP TABLE IF EXISTS `sales_pending`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `sales_pending` (
+  `order_id` int NOT NULL,
+  `item_id` int NOT NULL,
+  `sale_date` date NOT NULL,
+  `quantity` int NOT NULL,
+  `revenue` decimal(12,2) NOT NULL,
+  PRIMARY KEY (`order_id`,`item_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `sales_pending`
+--
+
+LOCK TABLES `sales_pending` WRITE;
+/*!40000 ALTER TABLE `sales_pending` DISABLE KEYS */;
+/*!40000 ALTER TABLE `sales_pending` ENABLE KEYS */;
+UNLOCK TABLES;
+
 --
 -- Dumping routines for database 'pandeyji_eatery'
 --
@@ -0,0 +1,775 @@
+# Author: Dhaval Patel. Codebasics YouTube Channel
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+from types import MappingProxyType
+
+import mysql.connector
+from dotenv import load_dotenv
+
+import metrics
+from cache_helper import TTLCache
+from item_matcher import ItemMatcher
+
+load_dotenv()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": int(os.getenv("DB_PORT", "3306")),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PASSWORD", ""),
+    "database": os.getenv("DB_NAME", "pandeyji_eatery"),
+    # Pooled connections are reused, so don't let a read hold an old snapshot open
+    "autocommit": True,
+}
+
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN", "2"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX", "10"))
+# Idle connections older than this are pinged before being handed out
+POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTH_CHECK_SECONDS", "30"))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5"))
+# Order IDs reserved from the database per round trip, per worker process
+ORDER_ID_BLOCK_SIZE = int(os.getenv("DB_ORDER_ID_BLOCK_SIZE", "20"))
+# The menu is reloaded from food_items when the cached copy is older than this
+MENU_TTL_SECONDS = float(os.getenv("MENU_TTL_SECONDS", "300"))
+# After a failed reload the cached menu is kept, and reloading is retried this much later
+MENU_REFRESH_RETRY_SECONDS = float(os.getenv("MENU_REFRESH_RETRY_SECONDS", "30"))
+
+# track_order is polled repeatedly, so statuses are cached. Writes made through this
+# process update the cache directly; the TTL bounds staleness for writes made elsewhere.
+ORDER_STATUS_CACHE_SIZE = int(os.getenv("ORDER_STATUS_CACHE_SIZE", "10000"))
+ORDER_STATUS_CACHE_TTL = float(os.getenv("ORDER_STATUS_CACHE_TTL_SECONDS", "30"))
+# Unknown order IDs are remembered for a shorter time
+ORDER_STATUS_NEGATIVE_TTL = float(os.getenv("ORDER_STATUS_NEGATIVE_TTL_SECONDS", "10"))
+
+# Status changes allowed through update_order_statuses; delivered and cancelled are final
+ORDER_STATUS_TRANSITIONS = {
+    "in progress": {"in transit", "delivered", "cancelled"},
+    "in transit": {"delivered", "cancelled"},
+    "delivered": set(),
+    "cancelled": set(),
+}
+# Order IDs per statement in bulk status updates, keeps packets well under max_allowed_packet
+STATUS_UPDATE_CHUNK_SIZE = int(os.getenv("ORDER_STATUS_UPDATE_CHUNK_SIZE", "1000"))
+# Order lines moved from sales_pending into the sales rollups per transaction
+SALES_ROLLUP_BATCH_SIZE = int(os.getenv("SALES_ROLLUP_BATCH_SIZE", "5000"))
+
+# Other names customers use for menu items, mapped to the name in food_items
+MENU_ALIASES = {
+    "biryani": "Vegetable Biryani",
+    "veg biryani": "Vegetable Biryani",
+    "lassi": "Mango Lassi",
+    "chole bhature": "Chole Bhature",
+    "chhole bhature": "Chole Bhature",
+    "chole bhatura": "Chole Bhature",
+    "vada pao": "Vada Pav",
+    "pao bhaji": "Pav Bhaji",
+}
+
+
+class PoolExhaustedError(mysql.connector.Error):
+    pass
+
+
+class ConnectionPool:
+    """Bounded pool of MySQL connections with health checks and reconnects."""
+
+    def __init__(self, min_size: int, max_size: int, connect=mysql.connector.connect, **connect_kwargs):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min={min_size}, max={max_size}")
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self._connect_func = connect
+        self._connect_kwargs = connect_kwargs
+        # Most recently used connection last. _available is notified whenever a connection
+        # is returned or a slot frees up, so waiters don't sleep out their timeout.
+        self._idle = []
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._size = 0
+        self._closed = False
+
+        for _ in range(min_size):
+            self._size += 1
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        # The caller has already reserved a slot in self._size
+        try:
+            return self._connect_func(**self._connect_kwargs)
+        except Exception:
+            self._free_slot()
+            raise
+
+    def _free_slot(self):
+        with self._available:
+            self._size -= 1
+            self._available.notify()
+
+    def _discard(self, cnx):
+        self._free_slot()
+        try:
+            cnx.close()
+        except mysql.connector.Error:
+            pass
+
+    def _is_healthy(self, cnx, last_used: float):
+        # is_connected() would ping too, so recently used connections are trusted as they are
+        if time.monotonic() - last_used < POOL_HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            cnx.ping(reconnect=True, attempts=2, delay=0)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def acquire(self, timeout: float = POOL_ACQUIRE_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while True:
+            cnx = None
+            with self._available:
+                while True:
+                    if self._closed:
+                        raise PoolExhaustedError("Connection pool is closed")
+                    if self._idle:
+                        cnx, last_used = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhaustedError(f"No database connection available after {timeout}s")
+                    self._available.wait(remaining)
+
+            if cnx is None:
+                return self._connect()
+            if self._is_healthy(cnx, last_used):
+                return cnx
+
+            # Broken connection, drop it and try again (a new one is opened if needed)
+            self._discard(cnx)
+
+    def release(self, cnx, broken: bool = False):
+        # No probe here, a dead connection is caught by the ping once it has been idle long enough
+        if self._closed or broken:
+            self._discard(cnx)
+            return
+
+        if cnx.in_transaction:
+            try:
+                cnx.rollback()
+            except mysql.connector.Error:
+                self._discard(cnx)
+                return
+        with self._available:
+            self._idle.append((cnx, time.monotonic()))
+            self._available.notify()
+
+    @contextmanager
+    def connection(self, name: str = "other"):
+        # Every DB call goes through here, so it is timed and counted under name, the
+        # function making it. Calls served from a cache never get here and aren't counted.
+        started = time.perf_counter()
+        try:
+            cnx = self.acquire()
+            broken = False
+            try:
+                yield cnx
+            except mysql.connector.Error:
+                # The connection may be in an unknown state, don't hand it out again
+                broken = True
+                raise
+            finally:
+                self.release(cnx, broken)
+        except Exception:
+            metrics.DB_CALL_ERRORS.inc(name)
+            raise
+        finally:
+            metrics.DB_CALL_SECONDS.observe(time.perf_counter() - started, name)
+
+    def close(self):
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            # Waiters give up rather than wait out their timeout
+            self._available.notify_all()
+        for cnx, _ in idle:
+            self._discard(cnx)
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+
+class OrderIdAllocator:
+    """Hands out order IDs from blocks reserved in the order_id_sequence table.
+
+    Each process reserves a whole block with one atomic UPDATE and then assigns
+    IDs from memory, so IDs stay unique across workers and hosts sharing the
+    database. IDs left in a block when a process exits are skipped, not reused.
+
+    With prefetch, the next block is reserved by a background thread once half
+    of the current one is used, so requests don't wait on MySQL for it.
+    """
+
+    def __init__(self, reserve_block, block_size: int = ORDER_ID_BLOCK_SIZE, prefetch: bool = False):
+        if block_size < 1:
+            raise ValueError(f"Invalid order ID block size: {block_size}")
+
+        self.block_size = block_size
+        self.prefetch = prefetch
+        self._reserve_block = reserve_block
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        # Start of a block reserved ahead of time
+        self._spare = None
+        self._prefetching = False
+        self._pid = os.getpid()
+
+    def next_id(self):
+        with self._lock:
+            # A forked child must not hand out IDs from its parent's blocks
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._next = self._end = 0
+                self._spare = None
+                self._prefetching = False
+
+            if self._next >= self._end:
+                if self._spare is not None:
+                    self._next, self._spare = self._spare, None
+                else:
+                    self._next = self._reserve_block(self.block_size)
+                self._end = self._next + self.block_size
+
+            order_id = self._next
+            self._next += 1
+
+            if (self.prefetch and self._spare is None and not self._prefetching
+                    and self._end - self._next <= self.block_size // 2):
+                self._prefetching = True
+                threading.Thread(target=self._prefetch_block, name="order-id-prefetch", daemon=True).start()
+
+            return order_id
+
+    def _prefetch_block(self):
+        pid = os.getpid()
+        try:
+            start = self._reserve_block(self.block_size)
+        except Exception as e:
+            # next_id() reserves the block itself when it runs out
+            print(f"Error reserving order ID block ahead of time: {e}")
+            start = None
+
+        with self._lock:
+            if self._pid == pid:
+                self._prefetching = False
+                if start is not None:
+                    self._spare = start
+
+
+MenuItem = namedtuple("MenuItem", ["item_id", "name", "price"])
+
+class MenuIndex:
+    """Immutable snapshot of food_items, looked up by name, alias, plural or a misspelling of them."""
+
+    def __init__(self, items, aliases: dict = None):
+        self.items = tuple(items)
+        self.by_id = MappingProxyType({item.item_id: item for item in items})
+        self._matcher = ItemMatcher(self.items, aliases)
+        self.loaded_at = time.monotonic()
+
+    def lookup(self, name: str):
+        return self._matcher.match(name)
+
+    def __len__(self):
+        return len(self.items)
+
+
+_pool = None
+_executor = None
+_menu = None
+_menu_lock = threading.Lock()
+# Set when a reload failed, the stale menu is served until then
+_menu_retry_at = 0.0
+
+_status_cache = TTLCache(ORDER_STATUS_CACHE_SIZE, ORDER_STATUS_CACHE_TTL)
+# Cached in place of a status for order IDs that don't exist
+_NO_SUCH_ORDER = object()
+
+
+def init_pool(min_size: int = POOL_MIN_SIZE, max_size: int = POOL_MAX_SIZE, connect=None):
+    # connect swaps in another DB-API driver with the mysql.connector interface
+    # (benchmark.sqlite_backend uses this to run without a MySQL server)
+    global _pool, _executor
+
+    if _pool is not None:
+        return _pool
+
+    if connect is None:
+        _pool = ConnectionPool(min_size, max_size, **DB_CONFIG)
+    else:
+        _pool = ConnectionPool(min_size, max_size, connect=connect)
+    # One worker per connection, so blocking DB calls never queue on the pool itself
+    _executor = ThreadPoolExecutor(max_workers=max_size, thread_name_prefix="db")
+    return _pool
+
+
+def close_pool():
+    global _pool, _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+def get_pool():
+    if _pool is None:
+        raise RuntimeError("Database pool is not initialised. Call db_helper.init_pool() first.")
+    return _pool
+
+
+async def run_blocking(func, *args, **kwargs):
+    # Offload a blocking call to the bounded DB executor so the event loop stays free
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def load_menu():
+    global _menu
+
+    with get_pool().connection("load_menu") as cnx:
+        cursor = cnx.cursor()
+        cursor.execute("SELECT item_id, name, price FROM food_items")
+        items = [MenuItem(item_id, name, price) for item_id, name, price in cursor.fetchall()]
+        cursor.close()
+
+    _menu = MenuIndex(items, MENU_ALIASES)
+    return _menu
+
+
+def get_menu():
+    global _menu_retry_at
+
+    menu = _menu
+    now = time.monotonic()
+    if menu is not None and (now - menu.loaded_at < MENU_TTL_SECONDS or now < _menu_retry_at):
+        return menu
+
+    if menu is None:
+        _menu_lock.acquire()
+    elif not _menu_lock.acquire(blocking=False):
+        # Another thread is already refreshing it, don't queue behind a slow database
+        return menu
+
+    try:
+        # Another thread may have refreshed it while we waited
+        if _menu is not menu:
+            return _menu
+        try:
+            return load_menu()
+        except mysql.connector.Error as err:
+            if menu is None:
+                raise
+            print(f"Error refreshing menu, serving the cached copy: {err}")
+            # Try again in MENU_REFRESH_RETRY_SECONDS rather than on every call while MySQL is down
+            _menu_retry_at = time.monotonic() + MENU_REFRESH_RETRY_SECONDS
+            return menu
+    finally:
+        _menu_lock.release()
+
+
+def invalidate_menu():
+    with _menu_lock:
+        return load_menu()
+
+
+def calculate_order_lines(order: dict):
+    # Prices a cart, {item_id: quantity}, from the cached menu.
+    # Returns ({item_id: (quantity, price)}, order total, item IDs no longer on the menu)
+    menu = get_menu()
+    lines = {}
+    unknown_items = []
+    for item_id, quantity in order.items():
+        item = menu.by_id.get(item_id)
+        if item is None:
+            unknown_items.append(item_id)
+            continue
+        lines[item_id] = (int(quantity), item.price)
+
+    order_total = sum(price * quantity for quantity, price in lines.values())
+    return lines, order_total, unknown_items
+
+
+def insert_order(order_id, order: dict, status="in progress"):
+    # order is a cart, {item_id: quantity}. Prices come from the cached menu, and all
+    # order rows plus the tracking row go in one transaction with a multi-row insert,
+    # so an order costs the same number of round trips whatever its size.
+    # Returns the order total, or -1 if an item is unknown or the write fails.
+    if not order:
+        return -1
+
+    lines, order_total, unknown_items = calculate_order_lines(order)
+    if unknown_items:
+        print(f"Error inserting order {order_id}: unknown items {unknown_items}")
+        return -1
+
+    try:
+        insert_orders([(order_id, lines)], status)
+        return order_total
+
+    except mysql.connector.Error as err:
+        print(f"Error inserting order {order_id}: {err}")
+        return -1
+
+
+def insert_orders(orders: list, status="in progress", ignore_existing=False, sale_dates: dict = None):
+    # Writes several already-priced orders, [(order_id, {item_id: (quantity, price)})],
+    # in one transaction: one multi-row insert each for their tracking rows, their items,
+    # and their lines in sales_pending (see fold_sales_rollups).
+    # ignore_existing skips orders that are already stored, so replaying a batch is safe.
+    # sale_dates maps order IDs to the day they are reported under, by default today.
+    # Raises mysql.connector.Error on failure.
+    with get_pool().connection("insert_orders") as cnx:
+        cursor = cnx.cursor()
+        cnx.start_transaction()
+
+        if ignore_existing:
+            orders = _insert_new_tracking_rows(cnx, cursor, orders, status)
+        elif orders:
+            values = ", ".join(["(%s, %s)"] * len(orders))
+            cursor.execute(
+                f"INSERT INTO order_tracking (order_id, status) VALUES {values}",
+                [value for order_id, _ in orders for value in (order_id, status)]
+            )
+
+        if orders:
+            item_rows = []
+            for order_id, lines in orders:
+                for item_id, (quantity, price) in lines.items():
+                    item_rows.extend((order_id, item_id, quantity, price * quantity))
+
+            values = ", ".join(["(%s, %s, %s, %s)"] * (len(item_rows) // 4))
+            cursor.execute(f"INSERT INTO orders (order_id, item_id, quantity, total_price) VALUES {values}", item_rows)
+            add_to_sales_pending(cursor, orders, sale_dates or {})
+
+        cnx.commit()
+        cursor.close()
+
+    # A replayed order may have moved on since, so only cache statuses we know we wrote
+    if not ignore_existing:
+        for order_id, _ in orders:
+            set_cached_order_status(order_id, status)
+
+
+def _insert_new_tracking_rows(cnx, cursor, orders: list, status: str):
+    # Inserts tracking rows for the orders that aren't stored yet and returns those orders,
+    # so only they get item rows and count towards the sales rollups. INSERT IGNORE locks
+    # just the rows it writes or finds; SELECT ... FOR UPDATE on IDs that don't exist yet
+    # would take gap locks that hold up live inserts and can deadlock two flushers.
+    if not orders:
+        return orders
+
+    # Plain consistent read, no locks
+    values = ", ".join(["%s"] * len(orders))
+    cursor.execute(f"SELECT order_id FROM order_tracking WHERE order_id IN ({values})", [order_id for order_id, _ in orders])
+    existing = {order_id for order_id, in cursor.fetchall()}
+    new_orders = [(order_id, lines) for order_id, lines in orders if order_id not in existing]
+    if not new_orders:
+        return new_orders
+
+    values = ", ".join(["(%s, %s)"] * len(new_orders))
+    cursor.execute(
+        f"INSERT IGNORE INTO order_tracking (order_id, status) VALUES {values}",
+        [value for order_id, _ in new_orders for value in (order_id, status)]
+    )
+    if cursor.rowcount == len(new_orders):
+        return new_orders
+
+    # Someone else stored some of them after the read. Start over one row at a time,
+    # so rowcount says which ones this transaction wrote.
+    cnx.rollback()
+    cnx.start_transaction()
+    new_orders = []
+    for order_id, lines in orders:
+        cursor.execute("INSERT IGNORE INTO order_tracking (order_id, status) VALUES (%s, %s)", (order_id, status))
+        if cursor.rowcount == 1:
+            new_orders.append((order_id, lines))
+    return new_orders
+
+
+def add_to_sales_pending(cursor, orders: list, sale_dates: dict):
+    # Only new rows of this order's own, so concurrent orders never wait on each other here.
+    # Updating the shared rollup rows is left to fold_sales_rollups.
+    today = date.today()
+    rows = [
+        (order_id, item_id, sale_dates.get(order_id, today), quantity, price * quantity)
+        for order_id, lines in orders
+        for item_id, (quantity, price) in lines.items()
+    ]
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+    cursor.execute(
+        f"INSERT INTO sales_pending (order_id, item_id, sale_date, quantity, revenue) VALUES {values}",
+        [value for row in rows for value in row]
+    )
+
+
+def fold_sales_rollups(limit: int = SALES_ROLLUP_BATCH_SIZE):
+    # Moves up to limit order lines from sales_pending into sales_daily and sales_daily_item,
+    # in one transaction, and returns the number of orders folded. Lines another process
+    # is folding are skipped rather than waited for.
+    with get_pool().connection("fold_sales_rollups") as cnx:
+        cursor = cnx.cursor()
+        cnx.start_transaction()
+        cursor.execute(
+            "SELECT order_id, item_id, sale_date, quantity, revenue FROM sales_pending "
+            "ORDER BY order_id, item_id LIMIT %s FOR UPDATE SKIP LOCKED",
+            (limit,)
+        )
+        rows = cursor.fetchall()
+        # A full batch may end partway through an order, which then waits for the next
+        # batch, so that it is counted once
+        if len(rows) == limit and rows[0][0] != rows[-1][0]:
+            rows = [row for row in rows if row[0] != rows[-1][0]]
+        if not rows:
+            cnx.commit()
+            cursor.close()
+            return 0
+
+        days = {}
+        day_items = {}
+        for order_id, item_id, sale_date, quantity, revenue in rows:
+            day = days.setdefault(sale_date, [set(), 0, 0])
+            day[0].add(order_id)
+            day[1] += quantity
+            day[2] += revenue
+            day_item = day_items.setdefault((sale_date, item_id), [0, 0, 0])
+            day_item[0] += 1
+            day_item[1] += quantity
+            day_item[2] += revenue
+
+        # Sorted, so processes folding at the same time lock rollup rows in the same order
+        values = ", ".join(["(%s, %s, %s, %s)"] * len(days))
+        cursor.execute(
+            f"INSERT INTO sales_daily (sale_date, order_count, item_count, revenue) VALUES {values} "
+            "ON DUPLICATE KEY UPDATE order_count = order_count + VALUES(order_count), "
+            "item_count = item_count + VALUES(item_count), revenue = revenue + VALUES(revenue)",
+            [value for sale_date, (order_ids, item_count, revenue) in sorted(days.items())
+             for value in (sale_date, len(order_ids), item_count, revenue)]
+        )
+        values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(day_items))
+        cursor.execute(
+            f"INSERT INTO sales_daily_item (sale_date, item_id, order_count, quantity, revenue) VALUES {values} "
+            "ON DUPLICATE KEY UPDATE order_count = order_count + VALUES(order_count), "
+            "quantity = quantity + VALUES(quantity), revenue = revenue + VALUES(revenue)",
+            [value for key, totals in sorted(day_items.items()) for value in (*key, *totals)]
+        )
+
+        order_ids = sorted({row[0] for row in rows})
+        values = ", ".join(["%s"] * len(order_ids))
+        cursor.execute(f"DELETE FROM sales_pending WHERE order_id IN ({values})", order_ids)
+        cnx.commit()
+        cursor.close()
+
+    return len(order_ids)
+
+
+def ensure_order_id_sequence():
+    # Creates and seeds the counter table on databases set up before it existed
+    with get_pool().connection("ensure_order_id_sequence") as cnx:
+        cursor = cnx.cursor()
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS order_id_sequence ("
+            " name VARCHAR(64) NOT NULL,"
+            " next_value INT NOT NULL,"
+            " PRIMARY KEY (name))"
+        )
+        cursor.execute(
+            "INSERT IGNORE INTO order_id_sequence (name, next_value) "
+            "SELECT 'orders', GREATEST("
+            " COALESCE((SELECT MAX(order_id) FROM orders), 0),"
+            " COALESCE((SELECT MAX(order_id) FROM order_tracking), 0)) + 1"
+        )
+        cursor.close()
+
+
+def ensure_sales_rollups():
+    # Per-day and per-item-per-day sales totals, so reports never scan orders. insert_orders
+    # queues each order's lines in sales_pending and fold_sales_rollups adds them up.
+    # Orders placed before these tables existed aren't in them.
+    with get_pool().connection("ensure_sales_rollups") as cnx:
+        cursor = cnx.cursor()
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS sales_daily ("
+            " sale_date DATE NOT NULL,"
+            " order_count INT NOT NULL,"
+            " item_count INT NOT NULL,"
+            " revenue DECIMAL(12,2) NOT NULL,"
+            " PRIMARY KEY (sale_date))"
+        )
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS sales_daily_item ("
+            " sale_date DATE NOT NULL,"
+            " item_id INT NOT NULL,"
+            " order_count INT NOT NULL,"
+            " quantity INT NOT NULL,"
+            " revenue DECIMAL(12,2) NOT NULL,"
+            " PRIMARY KEY (sale_date, item_id))"
+        )
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS sales_pending ("
+            " order_id INT NOT NULL,"
+            " item_id INT NOT NULL,"
+            " sale_date DATE NOT NULL,"
+            " quantity INT NOT NULL,"
+            " revenue DECIMAL(12,2) NOT NULL,"
+            " PRIMARY KEY (order_id, item_id))"
+        )
+        cursor.close()
+
+
+def reserve_order_id_block(block_size: int):
+    # LAST_INSERT_ID(expr) makes the increment and the read a single atomic
+    # statement, the new value comes back with the OK packet as lastrowid
+    with get_pool().connection("reserve_order_id_block") as cnx:
+        cursor = cnx.cursor()
+        cursor.execute(
+            "UPDATE order_id_sequence SET next_value = LAST_INSERT_ID(next_value + %s) "
+            "WHERE name = 'orders'",
+            (block_size,)
+        )
+        if cursor.rowcount != 1:
+            cursor.close()
+            raise RuntimeError("order_id_sequence is not seeded. Call db_helper.ensure_order_id_sequence() first.")
+        block_end = cursor.lastrowid
+        cursor.close()
+
+    return block_end - block_size
+
+
+order_id_allocator = OrderIdAllocator(reserve_order_id_block, prefetch=True)
+
+
+def get_next_order_id():
+    return order_id_allocator.next_id()
+
+
+def insert_order_tracking(order_id, status):
+    with get_pool().connection("insert_order_tracking") as cnx:
+        cursor = cnx.cursor()
+        insert_query = "INSERT INTO order_tracking (order_id, status) VALUES (%s, %s)"
+        cursor.execute(insert_query, (order_id, status))
+        cnx.commit()
+        cursor.close()
+
+    set_cached_order_status(order_id, status)
+
+
+def check_status_change(current_status, new_status):
+    # Returns why the change isn't allowed, or None if it is.
+    # Repeating the current status is allowed, so retried batches are harmless.
+    if new_status not in ORDER_STATUS_TRANSITIONS:
+        return f"unknown status '{new_status}'"
+    if current_status is None:
+        return "no such order"
+    if new_status != current_status and new_status not in ORDER_STATUS_TRANSITIONS.get(current_status, ()):
+        return f"cannot change status from '{current_status}' to '{new_status}'"
+    return None
+
+
+def update_order_statuses(updates: list):
+    # Applies [(order_id, status)] in one transaction. Current statuses are read
+    # with FOR UPDATE so concurrent batches can't interleave, then every allowed
+    # change is written with a multi-row upsert. Updates to the same order are
+    # applied in the given order. Disallowed updates are skipped, not fatal.
+    # Returns (changes [(order_id, old status, new status)], rejected [(order_id, status, reason)]).
+    # Raises mysql.connector.Error on failure.
+    # Sorted, so concurrent batches lock their rows chunk by chunk in the same order and can't deadlock
+    order_ids = sorted({order_id for order_id, _ in updates})
+    changes = []
+    rejected = []
+
+    with get_pool().connection("update_order_statuses") as cnx:
+        cursor = cnx.cursor()
+        cnx.start_transaction()
+        current = {}
+        for start in range(0, len(order_ids), STATUS_UPDATE_CHUNK_SIZE):
+            chunk = order_ids[start:start + STATUS_UPDATE_CHUNK_SIZE]
+            cursor.execute(
+                f"SELECT order_id, status FROM order_tracking "
+                f"WHERE order_id IN ({', '.join(['%s'] * len(chunk))}) FOR UPDATE",
+                chunk
+            )
+            current.update(cursor.fetchall())
+
+        final = {}
+        for order_id, status in updates:
+            current_status = final.get(order_id, current.get(order_id))
+            reason = check_status_change(current_status, status)
+            if reason is not None:
+                rejected.append((order_id, status, reason))
+            elif status != current_status:
+                changes.append((order_id, current_status, status))
+                final[order_id] = status
+
+        rows = sorted(final.items())
+        for start in range(0, len(rows), STATUS_UPDATE_CHUNK_SIZE):
+            chunk = rows[start:start + STATUS_UPDATE_CHUNK_SIZE]
+            cursor.execute(
+                f"INSERT INTO order_tracking (order_id, status) VALUES {', '.join(['(%s, %s)'] * len(chunk))} "
+                f"ON DUPLICATE KEY UPDATE status = VALUES(status)",
+                [value for row in chunk for value in row]
+            )
+        cnx.commit()
+        cursor.close()
+
+    for order_id, status in final.items():
+        set_cached_order_status(order_id, status)
+
+    return changes, rejected
+
+
+def set_cached_order_status(order_id, status):
+    # Write-through hook for every path that changes order_tracking
+    _status_cache.set(order_id, status)
+
+
+def get_order_status_cache_stats():
+    return _status_cache.stats()
+
+
+def get_order_status(order_id):
+    status = _status_cache.get(order_id)
+    if status is not None:
+        return None if status is _NO_SUCH_ORDER else status
+
+    with get_pool().connection("get_order_status") as cnx:
+        cursor = cnx.cursor()
+        query = "SELECT status FROM order_tracking WHERE order_id = %s"
+        cursor.execute(query, (order_id,))
+        result = cursor.fetchone()
+        cursor.close()
+
+    if result:
+        _status_cache.set(order_id, result[0])
+        return result[0]
+    else:
+        _status_cache.set(order_id, _NO_SUCH_ORDER, ttl=ORDER_STATUS_NEGATIVE_TTL)
+        return None
@@ -1,13 +1,26 @@
 # Author: Dhaval Patel. Codebasics YouTube Channel
 
+import json
 import re
 
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+SESSION_ID_RE = re.compile(r"/sessions/([^/]+)/contexts/")
+
 def extract_session_id(session_str: str):
-    match = re.search(r"/sessions/([^/]+)/contexts/", session_str)
+    match = SESSION_ID_RE.search(session_str)
     if match:
         return match.group(1)  # Only the session ID
     return ""
 
+def has_context(output_contexts: list, context_name: str):
+    suffix = "/contexts/" + context_name
+    return any(ctx['name'].endswith(suffix) for ctx in output_contexts)
+
 def get_str_from_food_dict(food_dict: dict):
     result = ", ".join([f"{int(value)} {key}" for key, value in food_dict.items()])
     return result
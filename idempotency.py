@@ -0,0 +1,154 @@
+import asyncio
+import os
+
+from fastapi import HTTPException, Response
+
+import db_helper
+from cache_helper import TTLCache
+from session_store import get_redis_client
+
+# Dialogflow retries a webhook call that timed out with the same responseId,
+# replies are kept long enough to answer any retry of it
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory")
+# How long another worker waits for the one handling a duplicate before giving up
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "5"))
+
+_PENDING = b"pending"
+
+
+class StoredResponse:
+    def __init__(self, status_code: int, body: bytes, media_type: str):
+        self.status_code = status_code
+        self.body = body
+        self.media_type = media_type
+
+    @classmethod
+    def from_response(cls, response: Response):
+        return cls(response.status_code, bytes(response.body), response.media_type)
+
+    def to_response(self):
+        return Response(content=self.body, status_code=self.status_code, media_type=self.media_type)
+
+    def encode(self):
+        return f"{self.status_code} {self.media_type}\n".encode() + self.body
+
+    @classmethod
+    def decode(cls, data: bytes):
+        header, body = data.split(b"\n", 1)
+        status_code, media_type = header.decode().split(" ", 1)
+        return cls(int(status_code), body, media_type)
+
+
+class RedisIdempotencyStore:
+    # Shares replies and in-flight claims between workers, like RedisSessionStore does carts
+
+    def __init__(self, client, ttl: int = IDEMPOTENCY_TTL_SECONDS, key_prefix: str = "webhook:"):
+        self._client = client
+        self._ttl = ttl
+        self._key_prefix = key_prefix
+
+    def get(self, key: str):
+        data = self._client.get(self._key_prefix + key)
+        if data is None or data == _PENDING:
+            return data
+        return StoredResponse.decode(data)
+
+    def claim(self, key: str):
+        # Only one worker gets to run the handler for a given key. The claim must outlive
+        # the slowest handler, or a retry could run it again. It only ever holds back
+        # retries of this one webhook call, so it is kept as long as the reply would be;
+        # a failed handler releases it straight away.
+        return bool(self._client.set(self._key_prefix + key, _PENDING, nx=True, ex=self._ttl))
+
+    def store(self, key: str, stored: StoredResponse):
+        self._client.set(self._key_prefix + key, stored.encode(), ex=self._ttl)
+
+    def release(self, key: str):
+        self._client.delete(self._key_prefix + key)
+
+
+class IdempotencyCache:
+    """
+    Runs a webhook handler at most once per key. Repeats get the stored reply,
+    and repeats that arrive while the first call is still running wait for it.
+    """
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_MAX_ENTRIES, ttl: int = IDEMPOTENCY_TTL_SECONDS, shared=None):
+        self._responses = TTLCache(max_entries, ttl)
+        self._inflight = {}
+        self._shared = shared
+        self.replays = 0
+
+    async def run(self, key: str, handler):
+        stored = self._responses.get(key)
+        if stored is not None:
+            self.replays += 1
+            return stored.to_response()
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.replays += 1
+            return (await asyncio.shield(inflight)).to_response()
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            if self._shared is not None:
+                stored = await self._run_shared(key, handler)
+            else:
+                stored = StoredResponse.from_response(await handler())
+
+            if stored.status_code == 200:
+                self._responses.set(key, stored)
+            future.set_result(stored)
+            return stored.to_response()
+
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody may be waiting, don't let asyncio complain about an unretrieved exception
+            future.exception()
+            raise
+
+        finally:
+            del self._inflight[key]
+
+    async def _run_shared(self, key: str, handler):
+        stored = await db_helper.run_blocking(self._shared.get, key)
+        if stored is None and await db_helper.run_blocking(self._shared.claim, key):
+            try:
+                stored = StoredResponse.from_response(await handler())
+            except BaseException:
+                await db_helper.run_blocking(self._shared.release, key)
+                raise
+            if stored.status_code == 200:
+                await db_helper.run_blocking(self._shared.store, key, stored)
+            else:
+                await db_helper.run_blocking(self._shared.release, key)
+            return stored
+
+        # Another worker is handling it, wait for its reply
+        self.replays += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + IDEMPOTENCY_WAIT_SECONDS
+        while stored is None or stored == _PENDING:
+            if loop.time() >= deadline:
+                # Fail rather than risk running the handler twice
+                raise HTTPException(status_code=503, detail="Duplicate request is still being processed")
+            await asyncio.sleep(0.05)
+            stored = await db_helper.run_blocking(self._shared.get, key)
+        return stored
+
+    def stats(self):
+        return dict(self._responses.stats(), inflight=len(self._inflight), replays=self.replays)
+
+
+def create_idempotency_cache(backend: str = IDEMPOTENCY_BACKEND):
+    if backend == "memory":
+        return IdempotencyCache()
+
+    if backend == "redis":
+        return IdempotencyCache(shared=RedisIdempotencyStore(get_redis_client("IDEMPOTENCY_BACKEND")))
+
+    raise ValueError(f"Unknown IDEMPOTENCY_BACKEND: {backend}")
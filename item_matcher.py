@@ -0,0 +1,126 @@
+import heapq
+import re
+from collections import Counter, defaultdict
+from itertools import chain
+
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+# Candidates ranked by shared trigrams that get an edit-distance check
+MAX_CANDIDATES = 8
+# On bigger menus, trigrams in more than this share of names say little about which
+# item was meant and would make every lookup walk long posting lists
+COMMON_GRAM_RATIO = 0.2
+COMMON_GRAM_MIN_MENU_SIZE = 50
+
+
+def singularize(word: str):
+    # Good enough for menu items: "samosas", "dosas", "lassies", "sandwiches"
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def normalize(name: str):
+    # "  Masala-Dosas " -> "masala dosa"
+    return " ".join(singularize(word) for word in _NON_WORD_RE.sub(" ", name.lower()).split())
+
+
+def trigrams(key: str):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int):
+    # Levenshtein distance with adjacent transpositions. Only cells within `limit`
+    # of the diagonal are computed, and it gives up as soon as the limit is exceeded.
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    over = limit + 1
+    previous2 = None
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        row_min = current[0]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return over
+        previous2, previous = previous, current
+    return min(previous[-1], over)
+
+
+def allowed_distance(key: str):
+    # One typo per four characters, at most three
+    return min(3, max(1, len(key) // 4))
+
+
+class ItemMatcher:
+    """
+    Resolves what a customer typed to a menu item. Exact matches on the
+    normalised name or an alias are a dict lookup; anything else is looked up
+    in a trigram index and the few best candidates are checked by edit distance,
+    so lookups don't scan the menu.
+    """
+
+    def __init__(self, items, aliases: dict = None):
+        self._exact = {}
+        for item in items:
+            self._exact.setdefault(normalize(item.name), item)
+
+        by_name = dict(self._exact)
+        for alias, target in (aliases or {}).items():
+            item = by_name.get(normalize(target))
+            if item is not None:
+                self._exact.setdefault(normalize(alias), item)
+
+        self._keys = list(self._exact)
+        postings = defaultdict(list)
+        for index, key in enumerate(self._keys):
+            for gram in trigrams(key):
+                postings[gram].append(index)
+
+        self._common = frozenset()
+        if len(self._keys) >= COMMON_GRAM_MIN_MENU_SIZE:
+            common = int(len(self._keys) * COMMON_GRAM_RATIO)
+            self._common = frozenset(gram for gram, ids in postings.items() if len(ids) > common)
+            postings = {gram: ids for gram, ids in postings.items() if gram not in self._common}
+        self._postings = {gram: tuple(ids) for gram, ids in postings.items()}
+
+    def match(self, text: str):
+        key = normalize(text)
+        item = self._exact.get(key)
+        if item is not None or not key:
+            return item
+
+        grams = trigrams(key)
+        # Counter counts an iterable in C, much faster than a Python loop over the postings
+        overlap = Counter(chain.from_iterable(self._postings.get(gram, ()) for gram in grams))
+
+        # Each edit changes at most four trigrams (a transposition touches four), names
+        # sharing fewer can't be close enough. Common trigrams have no postings and
+        # can't add to the overlap, so they are left out of the bound too.
+        limit = allowed_distance(key)
+        min_overlap = len(grams - self._common) - 4 * limit
+        candidates = [index for index, count in overlap.items() if count >= min_overlap]
+
+        best, best_distance = None, limit + 1
+        for index in heapq.nlargest(MAX_CANDIDATES, candidates, key=overlap.get):
+            distance = edit_distance(key, self._keys[index], limit)
+            if distance < best_distance:
+                best, best_distance = self._exact[self._keys[index]], distance
+        return best
+
+    def __len__(self):
+        return len(self._keys)
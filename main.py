@@ -1,51 +1,342 @@
 # Author: Dhaval Patel. Codebasics YouTube Channel
 
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import db_helper
+import hmac
+import json
+import logging
+import metrics
+import mysql.connector
+import order_events
+import order_journal
+import os
+import random
 import re
 import generic_helper
-from datetime import datetime, time
+import idempotency
+import reporting
+import session_store
+import static_assets
+from datetime import date, datetime, time
+from time import perf_counter
 
 app = FastAPI()
+app.add_middleware(metrics.MetricsMiddleware)
+
+logger = logging.getLogger(__name__)
+
+# Fraction of webhook payloads logged at DEBUG level, 0 disables payload logging
+PAYLOAD_LOG_SAMPLE_RATE = float(os.getenv("PAYLOAD_LOG_SAMPLE_RATE", "0"))
+
+# "number", "number1", ... hold the quantities of the extracted food items
+QUANTITY_KEY_RE = re.compile(r'^number(\d*)$')
+
+# Carts of sessions that haven't completed their order yet
+inprogress_orders = session_store.create_session_store()
+
+# Replies by (session, responseId), so Dialogflow retries don't run a handler twice
+webhook_replies = idempotency.create_idempotency_cache()
+
+# Bearer token for /menu/invalidate, the kitchen/delivery endpoints under /orders and /reports,
+# which are disabled while it is unset
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
+# Most status updates accepted in one request
+STATUS_UPDATE_MAX_BATCH = int(os.getenv("ORDER_STATUS_UPDATE_MAX_BATCH", "10000"))
+# Idle event streams get a comment this often, so proxies don't close them
+ORDER_EVENTS_KEEPALIVE_SECONDS = float(os.getenv("ORDER_EVENTS_KEEPALIVE_SECONDS", "15"))
+
+# Status changes made through this process, streamed at GET /orders/events
+status_events = order_events.OrderEventBus()
+
+# Only set when ORDER_WRITE_BEHIND is on, see order_journal
+pending_orders = None
+journal_flusher = None
+
+# frontend/, fingerprinted and precompressed at startup
+frontend = None
+# Adds committed orders to the sales rollups in the background
+rollup_folder = None
+
+
+@app.on_event("startup")
+def startup():
+    global frontend, pending_orders, journal_flusher, rollup_folder
+
+    if os.path.isdir(static_assets.FRONTEND_DIR):
+        frontend = static_assets.StaticAssets(static_assets.FRONTEND_DIR)
+
+    db_helper.init_pool()
+    db_helper.ensure_order_id_sequence()
+    db_helper.ensure_sales_rollups()
+    db_helper.load_menu()
+    rollup_folder = reporting.RollupFolder()
+    rollup_folder.start()
+
+    if order_journal.ORDER_WRITE_BEHIND:
+        pending_orders = order_journal.OrderJournal()
+        # Starts by replaying whatever a previous run left unflushed
+        journal_flusher = order_journal.JournalFlusher(pending_orders)
+        journal_flusher.start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    if journal_flusher is not None:
+        # The flusher thread uses the journal's SQLite connection until it exits
+        if journal_flusher.stop():
+            pending_orders.close()
+        else:
+            print("Order journal flusher did not stop in time, leaving the journal open")
+    if rollup_folder is not None:
+        rollup_folder.stop()
+    db_helper.close_pool()
 
-inprogress_orders = {}
 
 @app.post("/")
 async def handle_request(request: Request):
-    payload = await request.json()
-
-    # Print the whole payload to debug
-    print("Payload:", payload)
-
-    intent = payload['queryResult']['intent']['displayName']
-    parameters = payload['queryResult']['parameters']
-    output_contexts = payload['queryResult'].get('outputContexts', [])
-    session_id = generic_helper.extract_session_id(output_contexts[0]['name'])
-
-    # Detect active context names
-    context_names = [ctx['name'].split('/')[-1] for ctx in output_contexts]
-    is_new_order = 'new-order-context' in context_names
-
-    # Intent handlers
-    intent_handler_dict = {
-        'User.ThankYou': thank_you_response,
-        'Shop.Hours': shop_hours,
-        'Order.Start': start_new_order,
-        'Order.add - context: ongoing-order': lambda p, s: add_to_order(p, s, is_new_order),
-        'Order.Remove - context: ongoing-order': remove_from_order,
-        'Order.Complete - context: Ongoing-order': complete_order,
-        'tracking.order - context: ongoing-tracking': lambda p, s: track_order(p)
-    }
-
-    if intent in intent_handler_dict:
-        return intent_handler_dict[intent](parameters, session_id)
+    started = perf_counter()
+    response_id, intent, parameters, output_contexts = parse_webhook(await request.body())
+    metrics.WEBHOOK_PARSE_SECONDS.observe(perf_counter() - started)
+
+    handler = INTENT_HANDLERS.get(intent)
+    if handler is None:
+        return JSONResponse(content={
+            "fulfillmentText": "Sorry, I didn't understand that."
+        })
+
+    session_id = generic_helper.extract_session_id(output_contexts[0]['name']) if output_contexts else ""
+
+    started = perf_counter()
+    try:
+        if response_id:
+            return await webhook_replies.run(
+                f"{session_id}:{response_id}",
+                lambda: dispatch(handler, parameters, session_id, output_contexts)
+            )
+        return await dispatch(handler, parameters, session_id, output_contexts)
+    except Exception:
+        metrics.WEBHOOK_ERRORS.inc(intent)
+        raise
+    finally:
+        metrics.WEBHOOK_INTENT_SECONDS.observe(perf_counter() - started, intent)
+
+
+async def dispatch(handler, parameters: dict, session_id: str, output_contexts: list):
+    if handler is add_to_order:
+        # Only adding items cares whether Dialogflow just started a fresh order
+        is_new_order = generic_helper.has_context(output_contexts, 'new-order-context')
+        return await db_helper.run_blocking(add_to_order, parameters, session_id, is_new_order)
+
+    if handler in INLINE_HANDLERS:
+        return handler(parameters, session_id)
+
+    # Handlers block on MySQL, run them on the DB executor instead of the event loop
+    return await db_helper.run_blocking(handler, parameters, session_id)
+
+
+def parse_webhook(body: bytes):
+    payload = generic_helper.json_loads(body)
+
+    if PAYLOAD_LOG_SAMPLE_RATE and logger.isEnabledFor(logging.DEBUG) and random.random() < PAYLOAD_LOG_SAMPLE_RATE:
+        logger.debug("Payload: %s", payload)
+
+    query_result = payload['queryResult']
+    return (
+        payload.get('responseId'),
+        query_result['intent']['displayName'],
+        query_result['parameters'],
+        query_result.get('outputContexts') or [],
+    )
+
+
+@app.api_route("/", methods=["GET", "HEAD"])
+def home_page(request: Request):
+    if frontend is None or frontend.index is None:
+        raise HTTPException(status_code=404)
+    return static_assets.serve_asset(frontend.index, request)
+
+
+@app.api_route("/static/{name}", methods=["GET", "HEAD"])
+def static_file(name: str, request: Request):
+    asset = frontend.get(name) if frontend is not None else None
+    if asset is None:
+        raise HTTPException(status_code=404)
+    return static_assets.serve_asset(asset, request)
+
+
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@metrics.REGISTRY.add_collector
+def collect_app_metrics():
+    samples = []
+
+    pool = db_helper._pool
+    if pool is not None:
+        samples.append(("db_pool_connections", "gauge", "Open database connections.", pool.size))
+        samples.append(("db_pool_idle_connections", "gauge", "Idle database connections.", pool.idle))
+
+    # Shared backends can't count their carts cheaply
+    if hasattr(inprogress_orders, "__len__"):
+        samples.append(("inprogress_sessions", "gauge", "Sessions with an unfinished cart.", len(inprogress_orders)))
+
+    if pending_orders is not None:
+        samples.append(("order_journal_pending", "gauge", "Accepted orders not yet written to MySQL.", len(pending_orders)))
+        samples.append(("order_journal_failed", "gauge", "Orders MySQL kept rejecting, see failed_orders in the journal.", pending_orders.failed_count()))
+
+    replies = webhook_replies.stats()
+    samples.append(("webhook_replay_cache_entries", "gauge", "Stored webhook replies.", replies["size"]))
+    samples.append(("webhook_replays_total", "counter", "Duplicate webhook calls answered without running the handler.", replies["replays"]))
+
+    samples.append(("order_event_subscribers", "gauge", "Open order event streams.", len(status_events)))
+    samples.append(("order_status_changes_total", "counter", "Order status changes published.", status_events.published))
+
+    status_cache = db_helper.get_order_status_cache_stats()
+    samples.append(("order_status_cache_entries", "gauge", "Cached order statuses.", status_cache["size"]))
+    samples.append(("order_status_cache_hits_total", "counter", "Order status lookups served from cache.", status_cache["hits"]))
+    samples.append(("order_status_cache_misses_total", "counter", "Order status lookups that queried MySQL.", status_cache["misses"]))
+    return samples
+
+
+@app.post("/menu/invalidate")
+async def invalidate_menu(request: Request):
+    # Call after changing food_items so the new menu is used without waiting for MENU_TTL_SECONDS
+    require_admin(request)
+    menu = await db_helper.run_blocking(db_helper.invalidate_menu)
+    return JSONResponse(content={"items": len(menu)})
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return JSONResponse(content={"order_status": db_helper.get_order_status_cache_stats()})
+
+
+def require_admin(request: Request):
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Set ADMIN_API_TOKEN to enable this endpoint")
+
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    # Constant-time comparison, so the token can't be guessed from response times
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_API_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing bearer token", headers={"WWW-Authenticate": "Bearer"})
+
+
+def parse_status_updates(body: bytes):
+    # {"updates": [{"order_id": 41, "status": "delivered"}, ...]} -> [(41, "delivered"), ...]
+    expected = 'Expected {"updates": [{"order_id": <integer>, "status": <string>}, ...]}'
+    try:
+        updates = [(update["order_id"], update["status"]) for update in generic_helper.json_loads(body)["updates"]]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail=expected)
+
+    # bool is a subclass of int, and a list status would only fail later as an unhashable key
+    for order_id, status in updates:
+        if not isinstance(order_id, int) or isinstance(order_id, bool) or not isinstance(status, str):
+            raise HTTPException(status_code=400, detail=expected)
+
+    if len(updates) > STATUS_UPDATE_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {STATUS_UPDATE_MAX_BATCH} updates per request")
+    return updates
+
+
+@app.post("/orders/status")
+async def update_order_statuses(request: Request):
+    # Bulk status changes from kitchen and delivery systems, applied in one transaction
+    require_admin(request)
+    updates = parse_status_updates(await request.body())
+
+    try:
+        changes, rejected = await db_helper.run_blocking(db_helper.update_order_statuses, updates)
+    except mysql.connector.Error as err:
+        print(f"Error updating order statuses: {err}")
+        raise HTTPException(status_code=503, detail="Could not update order statuses, try again")
+
+    changed_at = datetime.now().isoformat(timespec="seconds")
+    status_events.publish([
+        {"order_id": order_id, "status": status, "previous_status": previous_status, "changed_at": changed_at}
+        for order_id, previous_status, status in changes
+    ])
 
     return JSONResponse(content={
-        "fulfillmentText": "Sorry, I didn't understand that."
+        "updated": len(changes),
+        "unchanged": len(updates) - len(changes) - len(rejected),
+        "rejected": [{"order_id": order_id, "status": status, "reason": reason} for order_id, status, reason in rejected],
     })
 
 
+@app.get("/orders/events")
+async def stream_order_events(request: Request):
+    # Server-sent events for status changes, ?order_id=1&order_id=2 to follow only some orders
+    require_admin(request)
+    try:
+        order_ids = [int(order_id) for order_id in request.query_params.getlist("order_id")]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="order_id must be an integer")
+
+    async def stream():
+        subscription = status_events.subscribe(order_ids)
+        try:
+            while True:
+                try:
+                    events = await subscription.get(ORDER_EVENTS_KEEPALIVE_SECONDS)
+                except order_events.SubscriberOverflow:
+                    # Events were lost, the client should reconnect and re-read the statuses it cares about
+                    yield "event: overflow\ndata: {}\n\n"
+                    return
+
+                if not events:
+                    yield ": keepalive\n\n"
+                for event in events:
+                    yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Stops nginx from buffering the stream
+        "X-Accel-Buffering": "no",
+    })
+
+
+@app.get("/reports/{name}")
+async def get_report(name: str, request: Request):
+    # ?from=2024-01-01&to=2024-01-31&format=csv&limit=500&after=<next_cursor of the previous page>
+    require_admin(request)
+    report = reporting.REPORTS.get(name)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"Unknown report, available: {', '.join(reporting.REPORTS)}")
+    columns, fetch = report
+
+    query = request.query_params
+    output_format = query.get("format", "json")
+    try:
+        start = date.fromisoformat(query["from"]) if query.get("from") else None
+        end = date.fromisoformat(query["to"]) if query.get("to") else None
+        limit = int(query.get("limit", reporting.REPORT_PAGE_SIZE))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from and to must be YYYY-MM-DD dates, limit a number")
+    if not 1 <= limit <= reporting.REPORT_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {reporting.REPORT_MAX_PAGE_SIZE}")
+    if output_format not in ("json", "csv"):
+        raise HTTPException(status_code=400, detail="format must be json or csv")
+
+    try:
+        rows, next_cursor = await db_helper.run_blocking(fetch, start, end, query.get("after"), limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid after cursor, pass the next_cursor of the previous page")
+    except mysql.connector.Error as err:
+        print(f"Error running {name} report: {err}")
+        raise HTTPException(status_code=503, detail="Could not run the report, try again")
+
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    if output_format == "csv":
+        return StreamingResponse(reporting.encode_csv(columns, rows), media_type="text/csv", headers=headers)
+    return StreamingResponse(reporting.encode_json(columns, rows, next_cursor), media_type="application/json", headers=headers)
+
+
 def thank_you_response(parameters: dict, session_id: str):
     return JSONResponse(content={
         "fulfillmentText": "You're welcome! Let me know if you'd like to place a new order or track one."
@@ -55,7 +346,7 @@ def thank_you_response(parameters: dict, session_id: str):
 
 def start_new_order(parameters: dict, session_id: str):
     # Clear previous order data
-    inprogress_orders[session_id] = {}
+    inprogress_orders.set(session_id, {})
     return JSONResponse(content={
         'fulfillmentText': "Okay, I've cleared your previous order. What would you like to order now?"
     })
@@ -83,58 +374,91 @@ def shop_hours(parameters: dict, session_id: str):
     })
 
 
-def add_to_order(parameters: dict, session_id: str, is_new_order: bool = False):
-    food_items = parameters.get("food-item", [])
-
-    quantity_keys = sorted(
-        [key for key in parameters.keys() if re.match(r'^number\d*$', key)],
-        key=lambda k: int(re.search(r'\d*$', k).group() or 0),
-        reverse=True
-    )
+def get_quantities(parameters: dict):
+    quantity_keys = []
+    for key in parameters:
+        match = QUANTITY_KEY_RE.match(key)
+        if match:
+            quantity_keys.append((int(match.group(1) or 0), key))
+    quantity_keys.sort(reverse=True)
 
     quantities = []
-    for key in quantity_keys:
-        quantities.extend(parameters.get(key, []))
+    for _, key in quantity_keys:
+        quantities.extend(parameters[key])
+    return quantities
+
+
+def add_to_order(parameters: dict, session_id: str, is_new_order: bool = False):
+    food_items = parameters.get("food-item", [])
+    quantities = get_quantities(parameters)
 
     if len(food_items) != len(quantities):
         fulfillment_text = f"Sorry, I couldn't match quantities to items. Items: {food_items}, Quantities: {quantities}"
     else:
-        new_food_dict = dict(zip(food_items, quantities))
-
-        if is_new_order or session_id not in inprogress_orders:
-            inprogress_orders[session_id] = new_food_dict
+        menu = db_helper.get_menu()
+        new_food_dict = {}
+        unknown_items = []
+        for food_item, quantity in zip(food_items, quantities):
+            item = menu.lookup(food_item)
+            if item is None:
+                unknown_items.append(food_item)
+            else:
+                # Carts hold item IDs, so different spellings of the same item add up to one line
+                new_food_dict[item.item_id] = new_food_dict.get(item.item_id, 0) + quantity
+
+        current_food_dict = None if is_new_order else inprogress_orders.get(session_id)
+        if current_food_dict is None:
+            current_food_dict = new_food_dict
         else:
-            current_food_dict = inprogress_orders[session_id]
             current_food_dict.update(new_food_dict)
-            inprogress_orders[session_id] = current_food_dict
+        inprogress_orders.set(session_id, current_food_dict)
 
-        order_str = generic_helper.get_str_from_food_dict(inprogress_orders[session_id])
-        fulfillment_text = f"So far you have: {order_str}. Do you need anything else?"
+        fulfillment_text = ""
+        if unknown_items:
+            fulfillment_text += f'Sorry, we don\'t have {", ".join(unknown_items)} on our menu. '
+
+        if current_food_dict:
+            order_str = describe_cart(current_food_dict, menu)
+            fulfillment_text += f"So far you have: {order_str}. Do you need anything else?"
+        else:
+            fulfillment_text += "What would you like to order?"
 
     return JSONResponse(content={
         'fulfillmentText': fulfillment_text
     })
 
 
+def describe_cart(cart: dict, menu):
+    # {item_id: quantity} -> "2 Pizza, 1 Samosa", named as on the menu
+    return generic_helper.get_str_from_food_dict({
+        menu.by_id[item_id].name if item_id in menu.by_id else f"item #{item_id}": quantity
+        for item_id, quantity in cart.items()
+    })
+
+
 def remove_from_order(parameters: dict, session_id: str):
-    if session_id not in inprogress_orders:
+    current_order = inprogress_orders.get(session_id)
+    if current_order is None:
         return JSONResponse(content={
             "fulfillmentText": "I'm having trouble finding your order. Sorry! Can you place a new order please?"
         })
 
     food_items = parameters["food-item"]
-    current_order = inprogress_orders[session_id]
+    menu = db_helper.get_menu()
 
     removed_items = []
     no_such_items = []
 
     for item in food_items:
-        if item in current_order:
-            removed_items.append(item)
-            del current_order[item]
+        menu_item = menu.lookup(item)
+        if menu_item is not None and menu_item.item_id in current_order:
+            removed_items.append(menu_item.name)
+            del current_order[menu_item.item_id]
         else:
             no_such_items.append(item)
 
+    inprogress_orders.set(session_id, current_order)
+
     fulfillment_text = ""
 
     if removed_items:
@@ -146,7 +470,7 @@ def remove_from_order(parameters: dict, session_id: str):
     if not current_order:
         fulfillment_text += " Your order is now empty."
     else:
-        order_str = generic_helper.get_str_from_food_dict(current_order)
+        order_str = describe_cart(current_order, menu)
         fulfillment_text += f" Here is what’s left in your order: {order_str}"
 
     return JSONResponse(content={
@@ -155,19 +479,21 @@ def remove_from_order(parameters: dict, session_id: str):
 
 
 def complete_order(parameters: dict, session_id: str):
-    if session_id not in inprogress_orders or not inprogress_orders[session_id]:
+    order = inprogress_orders.get(session_id)
+    if not order:
         fulfillment_text = "I'm having trouble finding your order. Sorry! Can you place a new order please?"
     else:
-        order = inprogress_orders[session_id]
-        order_id = save_to_db(order)
+        if pending_orders is not None:
+            order_id, order_total = save_to_journal(order)
+        else:
+            order_id, order_total = save_to_db(order)
 
         if order_id == -1:
             fulfillment_text = "Sorry, I couldn't process your order due to a backend error. Please place a new order again."
         else:
-            order_total = db_helper.get_total_order_price(order_id)
             fulfillment_text = f"Awesome. We've placed your order. Your order ID is #{order_id}. Your total is {order_total}. You can pay on delivery."
 
-        del inprogress_orders[session_id]
+        inprogress_orders.delete(session_id)
 
     return JSONResponse(content={
         "fulfillmentText": fulfillment_text
@@ -175,16 +501,40 @@ def complete_order(parameters: dict, session_id: str):
 
 
 def save_to_db(order: dict):
-    next_order_id = db_helper.get_next_order_id()
+    try:
+        next_order_id = db_helper.get_next_order_id()
+    except mysql.connector.Error as err:
+        print(f"Error allocating an order ID: {err}")
+        return -1, None
+
+    # Order rows and tracking are written in a single transaction
+    order_total = db_helper.insert_order(next_order_id, order, "in progress")
+    if order_total == -1:
+        return -1, None
+
+    return next_order_id, order_total
 
-    for food_item, quantity in order.items():
-        db_helper.insert_order_item(food_item, quantity, next_order_id)
 
-    db_helper.insert_order_tracking(next_order_id, "in progress")
-    return next_order_id
+def save_to_journal(order: dict):
+    # Priced from the cached menu and journaled locally, MySQL is written in the background
+    lines, order_total, unknown_items = db_helper.calculate_order_lines(order)
+    if unknown_items:
+        print(f"Error accepting order: unknown items {unknown_items}")
+        return -1, None
 
+    try:
+        # Usually served from a block reserved ahead of time, but may still need MySQL
+        next_order_id = db_helper.get_next_order_id()
+    except mysql.connector.Error as err:
+        print(f"Error allocating an order ID: {err}")
+        return -1, None
 
-def track_order(parameters: dict):
+    pending_orders.append(next_order_id, lines)
+    journal_flusher.wake()
+    return next_order_id, order_total
+
+
+def track_order(parameters: dict, session_id: str = None):
     order_id_param = parameters.get('order_id')
 
     if not order_id_param:
@@ -198,7 +548,10 @@ def track_order(parameters: dict):
         order_id = order_id_param
 
     order_id = int(order_id)
-    order_status = db_helper.get_order_status(order_id)
+    # Check the journal first: an order leaves it only after it is in MySQL
+    order_status = pending_orders.status(order_id) if pending_orders is not None else None
+    if order_status is None:
+        order_status = db_helper.get_order_status(order_id)
 
     if order_status:
         fulfillment_text = f'The order status for order ID {order_id} is: {order_status}'
@@ -208,3 +561,17 @@ def track_order(parameters: dict):
     return JSONResponse(content={
         'fulfillmentText': fulfillment_text
     })
+
+
+INTENT_HANDLERS = {
+    'User.ThankYou': thank_you_response,
+    'Shop.Hours': shop_hours,
+    'Order.Start': start_new_order,
+    'Order.add - context: ongoing-order': add_to_order,
+    'Order.Remove - context: ongoing-order': remove_from_order,
+    'Order.Complete - context: Ongoing-order': complete_order,
+    'tracking.order - context: ongoing-tracking': track_order,
+}
+
+# Handlers that never block, cheaper to run on the event loop than to hand off
+INLINE_HANDLERS = {thank_you_response, shop_hours}
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import threading
+from collections import deque
+
+# Events a subscriber may fall behind by before it is dropped and has to reconnect
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("ORDER_EVENTS_QUEUE_SIZE", "1000"))
+
+
+class SubscriberOverflow(Exception):
+    pass
+
+
+class Subscription:
+    def __init__(self, bus, loop, order_ids, max_pending: int):
+        self._bus = bus
+        self._loop = loop
+        self.order_ids = order_ids
+        self._max_pending = max_pending
+        self._pending = deque()
+        self._ready = asyncio.Event()
+        self.overflowed = False
+
+    def _deliver(self, event: dict):
+        # Always runs on the subscriber's event loop
+        if len(self._pending) >= self._max_pending:
+            self.overflowed = True
+        else:
+            self._pending.append(event)
+        self._ready.set()
+
+    async def get(self, timeout: float):
+        # Returns the events published since the last call, an empty list on timeout.
+        # Raises SubscriberOverflow if events were dropped because we fell behind.
+        if not self._pending and not self.overflowed:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+
+        if self.overflowed:
+            raise SubscriberOverflow(f"Subscriber fell more than {self._max_pending} events behind")
+
+        self._ready.clear()
+        events = list(self._pending)
+        self._pending.clear()
+        return events
+
+    def close(self):
+        self._bus.unsubscribe(self)
+
+
+class OrderEventBus:
+    """
+    In-process pub/sub for order status changes. publish() may be called from
+    any thread, each subscriber gets its events on its own event loop. Only
+    subscribers in this worker process see them.
+    """
+
+    def __init__(self, max_pending: int = SUBSCRIBER_QUEUE_SIZE):
+        self._max_pending = max_pending
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, order_ids=None):
+        # order_ids limits the subscription to those orders, None means every order
+        subscription = Subscription(
+            self, asyncio.get_running_loop(), frozenset(order_ids) if order_ids else None, self._max_pending
+        )
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, events: list):
+        # events are dicts with at least an "order_id"
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.published += len(events)
+
+        for subscription in subscribers:
+            for event in events:
+                if subscription.order_ids is None or event["order_id"] in subscription.order_ids:
+                    try:
+                        subscription._loop.call_soon_threadsafe(subscription._deliver, event)
+                    except RuntimeError:
+                        # Its loop has been closed, nobody is listening any more
+                        self.unsubscribe(subscription)
+                        break
+
+    def __len__(self):
+        with self._lock:
+            return len(self._subscribers)
+
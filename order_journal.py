@@ -0,0 +1,259 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
+import mysql.connector
+
+import db_helper
+
+# With write-behind on, complete_order replies as soon as the order is journaled
+# locally and a background thread copies it to MySQL
+ORDER_WRITE_BEHIND = os.getenv("ORDER_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+ORDER_JOURNAL_PATH = os.getenv("ORDER_JOURNAL_PATH", "order_journal.sqlite3")
+FLUSH_INTERVAL_SECONDS = float(os.getenv("ORDER_FLUSH_INTERVAL_SECONDS", "0.5"))
+FLUSH_BATCH_SIZE = int(os.getenv("ORDER_FLUSH_BATCH_SIZE", "100"))
+FLUSH_MAX_BACKOFF_SECONDS = float(os.getenv("ORDER_FLUSH_MAX_BACKOFF_SECONDS", "30"))
+# An order MySQL rejects this many times is moved to the failed_orders table
+FLUSH_MAX_ATTEMPTS = int(os.getenv("ORDER_FLUSH_MAX_ATTEMPTS", "5"))
+
+# Reported by track_order for orders that are journaled but not in MySQL yet
+RECEIVED_STATUS = "received"
+# Reported for orders MySQL kept rejecting, which need someone to look at them
+FAILED_STATUS = "failed"
+
+# Errors about the order itself, like an item deleted from food_items since it was priced.
+# Anything else (lost connection, lock wait timeout...) is retried for the whole batch.
+REJECTED_ERRORS = (mysql.connector.IntegrityError, mysql.connector.DataError)
+
+
+class OrderJournal:
+    """
+    Durable local queue of accepted orders, kept in an SQLite WAL database.
+    An order stays here until it has been committed to MySQL, so a crash at
+    any point either replays it or finds it already flushed.
+    """
+
+    def __init__(self, path: str = ORDER_JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cnx = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._cnx.execute("PRAGMA journal_mode=WAL")
+        # Every append is fsynced before the customer is told the order was placed
+        self._cnx.execute("PRAGMA synchronous=FULL")
+        self._cnx.execute("PRAGMA busy_timeout=5000")
+        self._cnx.execute(
+            "CREATE TABLE IF NOT EXISTS pending_orders ("
+            " order_id INTEGER PRIMARY KEY,"
+            " lines TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " last_error TEXT)"
+        )
+        # Dead letters: orders MySQL rejected FLUSH_MAX_ATTEMPTS times, kept for inspection
+        self._cnx.execute(
+            "CREATE TABLE IF NOT EXISTS failed_orders ("
+            " order_id INTEGER PRIMARY KEY,"
+            " lines TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL,"
+            " last_error TEXT,"
+            " failed_at REAL NOT NULL)"
+        )
+
+    def append(self, order_id: int, lines: dict):
+        # lines is {item_id: (quantity, price)} as returned by db_helper.calculate_order_lines
+        encoded = json.dumps({str(item_id): [quantity, str(price)] for item_id, (quantity, price) in lines.items()})
+        with self._lock:
+            self._cnx.execute(
+                "INSERT INTO pending_orders (order_id, lines, created_at) VALUES (?, ?, ?)",
+                (order_id, encoded, time.time())
+            )
+
+    def pending(self, limit: int = FLUSH_BATCH_SIZE):
+        # Returns [(order_id, lines, created_at)], oldest first
+        with self._lock:
+            rows = self._cnx.execute(
+                "SELECT order_id, lines, created_at FROM pending_orders ORDER BY order_id LIMIT ?", (limit,)
+            ).fetchall()
+
+        orders = []
+        for order_id, encoded, created_at in rows:
+            lines = {int(item_id): (quantity, Decimal(price)) for item_id, (quantity, price) in json.loads(encoded).items()}
+            orders.append((order_id, lines, created_at))
+        return orders
+
+    def remove(self, order_ids: list):
+        with self._lock:
+            self._cnx.executemany("DELETE FROM pending_orders WHERE order_id = ?", [(order_id,) for order_id in order_ids])
+
+    def record_error(self, order_ids: list, error: str):
+        with self._lock:
+            self._cnx.executemany(
+                "UPDATE pending_orders SET last_error = ? WHERE order_id = ?", [(error, order_id) for order_id in order_ids]
+            )
+
+    def record_rejection(self, order_id: int, error: str):
+        # Returns how many times MySQL has rejected the order
+        with self._lock:
+            self._cnx.execute(
+                "UPDATE pending_orders SET attempts = attempts + 1, last_error = ? WHERE order_id = ?", (error, order_id)
+            )
+            row = self._cnx.execute("SELECT attempts FROM pending_orders WHERE order_id = ?", (order_id,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def move_to_failed(self, order_id: int):
+        with self._lock:
+            self._cnx.execute("BEGIN IMMEDIATE")
+            try:
+                self._cnx.execute(
+                    "INSERT OR REPLACE INTO failed_orders (order_id, lines, created_at, attempts, last_error, failed_at)"
+                    " SELECT order_id, lines, created_at, attempts, last_error, ? FROM pending_orders WHERE order_id = ?",
+                    (time.time(), order_id)
+                )
+                self._cnx.execute("DELETE FROM pending_orders WHERE order_id = ?", (order_id,))
+                self._cnx.execute("COMMIT")
+            except BaseException:
+                self._cnx.execute("ROLLBACK")
+                raise
+
+    def is_pending(self, order_id: int):
+        # Reads the file rather than an in-memory set, so orders journaled by other
+        # workers sharing it are seen too
+        with self._lock:
+            row = self._cnx.execute("SELECT 1 FROM pending_orders WHERE order_id = ?", (order_id,)).fetchone()
+        return row is not None
+
+    def status(self, order_id: int):
+        # RECEIVED_STATUS, FAILED_STATUS, or None once the order is in MySQL (or unknown)
+        with self._lock:
+            row = self._cnx.execute(
+                "SELECT ? FROM pending_orders WHERE order_id = ? UNION ALL SELECT ? FROM failed_orders WHERE order_id = ?",
+                (RECEIVED_STATUS, order_id, FAILED_STATUS, order_id)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def failed_count(self):
+        with self._lock:
+            return self._cnx.execute("SELECT COUNT(*) FROM failed_orders").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._cnx.execute("SELECT COUNT(*) FROM pending_orders").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._cnx.close()
+
+
+class JournalFlusher:
+    """
+    Background thread that copies journaled orders to MySQL in batches, retrying
+    with backoff. An order MySQL keeps rejecting is moved to failed_orders after
+    max_attempts, so it doesn't block the orders behind it.
+    """
+
+    def __init__(self, journal: OrderJournal, interval: float = FLUSH_INTERVAL_SECONDS,
+                 batch_size: int = FLUSH_BATCH_SIZE, max_backoff: float = FLUSH_MAX_BACKOFF_SECONDS,
+                 max_attempts: int = FLUSH_MAX_ATTEMPTS):
+        self.journal = journal
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="order-journal-flusher", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout: float = 10):
+        # Returns False if the thread is still running after timeout
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def flush_once(self):
+        # Returns the number of orders written, raises if MySQL couldn't be written at all
+        orders = self.journal.pending(self.batch_size)
+        if not orders:
+            return 0
+
+        order_ids = [order_id for order_id, _, _ in orders]
+        try:
+            self._insert(orders)
+        except REJECTED_ERRORS:
+            # Some order in the batch is bad. Retry them one at a time, so it doesn't
+            # hold up every order journaled after it.
+            return self._flush_one_by_one(orders)
+        except mysql.connector.Error as err:
+            self.journal.record_error(order_ids, str(err))
+            raise
+
+        self.journal.remove(order_ids)
+        return len(orders)
+
+    def _flush_one_by_one(self, orders: list):
+        flushed = 0
+        for order in orders:
+            order_id = order[0]
+            try:
+                self._insert([order])
+            except REJECTED_ERRORS as err:
+                attempts = self.journal.record_rejection(order_id, str(err))
+                if attempts >= self.max_attempts:
+                    self.journal.move_to_failed(order_id)
+                    print(f"Order {order_id} rejected by MySQL {attempts} times, moved to failed_orders: {err}")
+                continue
+            except mysql.connector.Error as err:
+                self.journal.record_error([order_id], str(err))
+                raise
+
+            self.journal.remove([order_id])
+            flushed += 1
+        return flushed
+
+    @staticmethod
+    def _insert(orders: list):
+        # Orders flushed just before a crash are still journaled, ignore_existing skips them.
+        # Sales are reported under the day the order was accepted, not the day it was flushed.
+        db_helper.insert_orders(
+            [(order_id, lines) for order_id, lines, _ in orders], "in progress", ignore_existing=True,
+            sale_dates={order_id: date.fromtimestamp(created_at) for order_id, _, created_at in orders}
+        )
+
+    def _run(self):
+        backoff = self.interval
+        while True:
+            try:
+                flushed = self.flush_once()
+                backoff = self.interval
+            except Exception as e:
+                print(f"Error flushing order journal, retrying in {backoff:.1f}s: {e}")
+                flushed = 0
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                if not self._stopping.is_set():
+                    continue
+
+            if self._stopping.is_set():
+                # Last attempt to drain before shutdown; anything left is replayed on restart
+                if flushed:
+                    continue
+                return
+
+            # A full batch means there is probably more waiting
+            if flushed < self.batch_size:
+                self._wake.wait(self.interval)
+                self._wake.clear()
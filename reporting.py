@@ -0,0 +1,204 @@
+import csv
+import io
+import json
+import os
+import threading
+from datetime import date
+from decimal import Decimal
+
+import db_helper
+
+# Rows per page when the request doesn't say, and the most it may ask for
+REPORT_PAGE_SIZE = int(os.getenv("REPORT_PAGE_SIZE", "500"))
+REPORT_MAX_PAGE_SIZE = int(os.getenv("REPORT_MAX_PAGE_SIZE", "5000"))
+# Rows encoded per chunk of a streamed response
+_ROWS_PER_CHUNK = 200
+# How often new orders are added to the rollups, reports lag behind orders by about this much
+SALES_ROLLUP_INTERVAL_SECONDS = float(os.getenv("SALES_ROLLUP_INTERVAL_SECONDS", "5"))
+SALES_ROLLUP_MAX_BACKOFF_SECONDS = float(os.getenv("SALES_ROLLUP_MAX_BACKOFF_SECONDS", "60"))
+
+# Reports read only the rollup tables RollupFolder keeps up to date, and pages
+# continue after the last key of the previous one (keyset pagination) instead of
+# using OFFSET, so a page costs the same however far into the report it is.
+
+
+class RollupFolder:
+    """
+    Background thread that adds newly committed orders to the sales rollups with
+    db_helper.fold_sales_rollups. Orders only append their own rows to sales_pending,
+    so they never wait on each other for the shared rollup rows. Every worker runs
+    one; they skip the rows another is folding.
+    """
+
+    def __init__(self, interval: float = SALES_ROLLUP_INTERVAL_SECONDS,
+                 max_backoff: float = SALES_ROLLUP_MAX_BACKOFF_SECONDS):
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sales-rollup-folder", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        # Returns False if the thread is still running after timeout. Anything not folded
+        # yet stays in sales_pending for the next run.
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def _run(self):
+        backoff = self.interval
+        while not self._stopping.is_set():
+            try:
+                folded = db_helper.fold_sales_rollups()
+                backoff = self.interval
+            except Exception as e:
+                print(f"Error updating sales rollups, retrying in {backoff:.1f}s: {e}")
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            # Anything folded may mean a backlog, keep going until it is drained
+            if not folded:
+                self._stopping.wait(self.interval)
+
+
+def _query(name: str, query: str, params: list):
+    with db_helper.get_pool().connection(name) as cnx:
+        cursor = cnx.cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows
+
+
+def _date_range(column: str, start: date = None, end: date = None):
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append(f"{column} >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append(f"{column} <= %s")
+        params.append(end)
+    return conditions, params
+
+
+def _where(conditions: list):
+    return "WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+def _item_name(menu, item_id: int):
+    item = menu.by_id.get(item_id)
+    return item.name if item is not None else None
+
+
+def daily_sales(start: date = None, end: date = None, after: str = None, limit: int = REPORT_PAGE_SIZE):
+    # One row per day. after is the next_cursor of the previous page, a date.
+    # Returns (rows, next_cursor), next_cursor is None on the last page.
+    conditions, params = _date_range("sale_date", start, end)
+    if after:
+        conditions.append("sale_date > %s")
+        params.append(date.fromisoformat(after))
+
+    rows = _query(
+        "daily_sales",
+        f"SELECT sale_date, order_count, item_count, revenue FROM sales_daily {_where(conditions)} "
+        f"ORDER BY sale_date LIMIT %s",
+        params + [limit + 1]
+    )
+    next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+
+    return [
+        (sale_date, order_count, item_count, revenue, round(revenue / order_count, 2) if order_count else 0)
+        for sale_date, order_count, item_count, revenue in rows[:limit]
+    ], next_cursor
+
+
+def item_sales(start: date = None, end: date = None, after: str = None, limit: int = REPORT_PAGE_SIZE):
+    # One row per item and day. after is "date,item_id", the next_cursor of the previous page.
+    conditions, params = _date_range("sale_date", start, end)
+    if after:
+        after_date, after_item_id = after.split(",")
+        after_date = date.fromisoformat(after_date)
+        # Spelled out rather than as a row comparison, which older MySQL can't use the primary key for
+        conditions.append("(sale_date > %s OR (sale_date = %s AND item_id > %s))")
+        params.extend((after_date, after_date, int(after_item_id)))
+
+    rows = _query(
+        "item_sales",
+        f"SELECT sale_date, item_id, order_count, quantity, revenue FROM sales_daily_item {_where(conditions)} "
+        f"ORDER BY sale_date, item_id LIMIT %s",
+        params + [limit + 1]
+    )
+    next_cursor = f"{rows[limit - 1][0]},{rows[limit - 1][1]}" if len(rows) > limit else None
+
+    # Names come from the cached menu rather than a join with food_items
+    menu = db_helper.get_menu()
+    return [
+        (sale_date, item_id, _item_name(menu, item_id), order_count, quantity, revenue)
+        for sale_date, item_id, order_count, quantity, revenue in rows[:limit]
+    ], next_cursor
+
+
+def top_items(start: date = None, end: date = None, after: str = None, limit: int = REPORT_PAGE_SIZE):
+    # Best sellers by quantity over the date range. Reads one rollup row per item and
+    # day in the range, and there are only as many items as the menu has, so it has
+    # a single page and ignores after.
+    conditions, params = _date_range("sale_date", start, end)
+    rows = _query(
+        "top_items",
+        f"SELECT item_id, SUM(order_count), SUM(quantity), SUM(revenue) FROM sales_daily_item {_where(conditions)} "
+        f"GROUP BY item_id ORDER BY SUM(quantity) DESC, item_id LIMIT %s",
+        params + [limit]
+    )
+
+    menu = db_helper.get_menu()
+    return [
+        (rank, item_id, _item_name(menu, item_id), order_count, quantity, revenue)
+        for rank, (item_id, order_count, quantity, revenue) in enumerate(rows, 1)
+    ], None
+
+
+# name -> (columns, function returning (rows, next_cursor))
+REPORTS = {
+    "daily": (("date", "orders", "items", "revenue", "average_basket"), daily_sales),
+    "items": (("date", "item_id", "name", "orders", "quantity", "revenue"), item_sales),
+    "top-items": (("rank", "item_id", "name", "orders", "quantity", "revenue"), top_items),
+}
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} as JSON")
+
+
+def encode_json(columns: tuple, rows: list, next_cursor: str = None):
+    # {"columns": [...], "rows": [{...}, ...], "next_cursor": ...}, yielded in chunks
+    yield '{"columns": ' + json.dumps(columns) + ', "rows": ['
+    for start in range(0, len(rows), _ROWS_PER_CHUNK):
+        chunk = ", ".join(
+            json.dumps(dict(zip(columns, row)), default=_json_default) for row in rows[start:start + _ROWS_PER_CHUNK]
+        )
+        yield (", " if start else "") + chunk
+    yield '], "next_cursor": ' + json.dumps(next_cursor) + "}"
+
+
+def encode_csv(columns: tuple, rows: list):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for start in range(0, len(rows), _ROWS_PER_CHUNK):
+        writer.writerows(rows[start:start + _ROWS_PER_CHUNK])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,105 @@
+import json
+import os
+from abc import ABC, abstractmethod
+
+from cache_helper import TTLCache
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+# Carts untouched for this long are dropped
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class SessionStore(ABC):
+    """Stores the in-progress cart (item_id -> quantity) of each Dialogflow session."""
+
+    @abstractmethod
+    def get(self, session_id: str):
+        pass
+
+    @abstractmethod
+    def set(self, session_id: str, order: dict):
+        pass
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    # Per-process LRU, only suitable for a single uvicorn worker
+
+    def __init__(self, max_entries: int = SESSION_MAX_ENTRIES, ttl: int = SESSION_TTL_SECONDS):
+        self._carts = TTLCache(max_entries, ttl)
+
+    def get(self, session_id: str):
+        order = self._carts.get(session_id)
+        if order is None:
+            return None
+        # Hand out a copy so callers must set() their changes back, like the shared backends
+        self._carts.touch(session_id)
+        return dict(order)
+
+    def set(self, session_id: str, order: dict):
+        self._carts.set(session_id, dict(order))
+
+    def delete(self, session_id: str):
+        self._carts.pop(session_id)
+
+    def __len__(self):
+        return len(self._carts)
+
+
+class RedisSessionStore(SessionStore):
+    # Shared across workers and hosts. Any client speaking the redis-py
+    # get/set/delete API works, which lets tests pass in a local fake.
+
+    def __init__(self, client, ttl: int = SESSION_TTL_SECONDS, key_prefix: str = "cart:"):
+        self._client = client
+        self._ttl = ttl
+        self._key_prefix = key_prefix
+
+    def get(self, session_id: str):
+        value = self._client.get(self._key_prefix + session_id)
+        if value is None:
+            return None
+        # JSON object keys are strings, item IDs are ints
+        try:
+            return {int(item_id): quantity for item_id, quantity in json.loads(value).items()}
+        except ValueError:
+            # Cart keyed by item names, stored before carts held item IDs
+            return None
+
+    def set(self, session_id: str, order: dict):
+        self._client.set(self._key_prefix + session_id, json.dumps(order), ex=self._ttl)
+
+    def delete(self, session_id: str):
+        self._client.delete(self._key_prefix + session_id)
+
+
+_redis_client = None
+
+
+def get_redis_client(setting: str = "SESSION_BACKEND"):
+    # One client, and so one connection pool, for everything kept in Redis.
+    # setting names the variable that asked for Redis, for the error message.
+    global _redis_client
+
+    if _redis_client is None:
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(f"{setting}=redis requires the 'redis' package: pip install redis")
+        _redis_client = redis.Redis.from_url(REDIS_URL)
+    return _redis_client
+
+
+def create_session_store(backend: str = SESSION_BACKEND):
+    if backend == "memory":
+        return MemorySessionStore()
+
+    if backend == "redis":
+        return RedisSessionStore(get_redis_client("SESSION_BACKEND"))
+
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
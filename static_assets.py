@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FRONTEND_DIR = os.getenv("FRONTEND_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend"))
+STATIC_URL_PREFIX = "/static/"
+
+# Fingerprinted URLs change whenever the content does, so they can be cached forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Pages keep their URL, browsers revalidate them with If-None-Match
+PAGE_CACHE_CONTROL = "no-cache"
+
+# Images are already compressed, gzip/brotli would only waste CPU
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+_ASSET_REF_RE = re.compile(r'(\b(?:src|href)=")([^"#?:]+)(")')
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class Asset:
+    def __init__(self, url: str, body: bytes, content_type: str, cache_control: str):
+        self.url = url
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        # encoding -> body, identity is always present
+        self.variants = {"identity": body}
+
+        if content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed["br"] = brotli.compress(body, quality=11)
+            for encoding, data in compressed.items():
+                if len(data) < len(body):
+                    self.variants[encoding] = data
+
+    def etag(self, encoding: str):
+        return f'"{self.digest}-{encoding}"' if encoding != "identity" else f'"{self.digest}"'
+
+
+class StaticAssets:
+    """
+    Serves frontend/ from memory. Every file gets a content-hashed URL under
+    /static/, HTML pages are rewritten to use them, and text assets are
+    precompressed with gzip (and brotli when installed) once at startup.
+    """
+
+    def __init__(self, directory: str = FRONTEND_DIR, index: str = "home.html"):
+        self.directory = directory
+        self.assets = {}
+        self.urls = {}
+        self.pages = {}
+
+        files = sorted(
+            name for name in os.listdir(directory)
+            if not name.startswith(".") and os.path.isfile(os.path.join(directory, name))
+        )
+
+        for name in files:
+            if not name.endswith(".html"):
+                self._add_asset(name)
+
+        # Pages go last, they reference the fingerprinted URLs of everything else
+        for name in files:
+            if name.endswith(".html"):
+                with open(os.path.join(directory, name), "rb") as f:
+                    html = f.read().decode("utf-8")
+                html = _ASSET_REF_RE.sub(lambda m: m.group(1) + self.urls.get(m.group(2), m.group(2)) + m.group(3), html)
+                self.pages[name] = Asset("/" + name, html.encode("utf-8"), "text/html", PAGE_CACHE_CONTROL)
+
+        self.index = self.pages.get(index)
+
+    def _add_asset(self, name: str):
+        with open(os.path.join(self.directory, name), "rb") as f:
+            body = f.read()
+
+        # Starlette adds "; charset=utf-8" to text/* types itself
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+        stem, ext = os.path.splitext(name)
+        asset = Asset("", body, content_type, IMMUTABLE_CACHE_CONTROL)
+        asset.url = f"{STATIC_URL_PREFIX}{stem}.{asset.digest[:12]}{ext}"
+
+        self.assets[asset.url[len(STATIC_URL_PREFIX):]] = asset
+        self.urls[name] = asset.url
+
+    def get(self, fingerprinted_name: str):
+        return self.assets.get(fingerprinted_name)
+
+
+def choose_encoding(asset: Asset, accept_encoding: str):
+    accepted = {part.split(";")[0].strip() for part in accept_encoding.split(",")} if accept_encoding else set()
+    for encoding in ("br", "gzip"):
+        if encoding in asset.variants and encoding in accepted:
+            return encoding
+    return "identity"
+
+
+def serve_asset(asset: Asset, request: Request):
+    # Ranges are only served on the uncompressed body, where byte offsets are unambiguous
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", asset.etag("identity")) == asset.etag("identity"):
+        encoding = "identity"
+    else:
+        range_header = None
+        encoding = choose_encoding(asset, request.headers.get("accept-encoding", ""))
+
+    etag = asset.etag(encoding)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": asset.cache_control,
+        "Vary": "Accept-Encoding",
+        "Accept-Ranges": "bytes",
+    }
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    body = asset.variants[encoding]
+    if range_header:
+        return _serve_range(body, range_header, asset.content_type, headers)
+
+    return Response(content=body, media_type=asset.content_type, headers=headers)
+
+
+def _serve_range(body: bytes, range_header: str, content_type: str, headers: dict):
+    size = len(body)
+    match = _RANGE_RE.match(range_header.strip())
+    if not match or match.groups() == ("", ""):
+        # Multiple or malformed ranges: ignore them and send the whole thing, as RFC 9110 allows
+        return Response(content=body, media_type=content_type, headers=headers)
+
+    first, last = match.groups()
+    if first == "":
+        # "bytes=-500" is the last 500 bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+
+    if start >= size or start > end:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content=body[start:end + 1], status_code=206, media_type=content_type, headers=headers)
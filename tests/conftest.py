@@ -0,0 +1,86 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Modules live at the repository root, next to main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_helper
+from benchmark import sqlite_backend
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    # A fresh SQLite copy of db/pandeyji_eatery.sql behind db_helper's pool
+    path = str(tmp_path / "pandeyji_eatery.sqlite3")
+    sqlite_backend.install(path, min_size=1, max_size=4)
+    # Statuses cached by an earlier test belong to another database
+    db_helper._status_cache.clear()
+    yield path
+    db_helper.close_pool()
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Drives every TTL in cache_helper and FakeRedis instead of the real monotonic clock
+    import cache_helper
+
+    fake = FakeClock()
+    # Replaces the module's reference only, asyncio keeps the real clock
+    monkeypatch.setattr(cache_helper, "time", SimpleNamespace(monotonic=fake))
+    return fake
+
+
+class FakeRedis:
+    """The subset of the redis-py client the app uses, with key expiry on a FakeClock."""
+
+    def __init__(self, clock: FakeClock):
+        self._clock = clock
+        self._data = {}
+
+    def _live(self, key: str):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= self._clock():
+            del self._data[key]
+            entry = None
+        return entry
+
+    def get(self, key: str):
+        entry = self._live(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key: str, value, ex: int = None, nx: bool = False):
+        if nx and self._live(key) is not None:
+            return None
+        if isinstance(value, str):
+            value = value.encode()
+        self._data[key] = (value, self._clock() + ex if ex is not None else None)
+        return True
+
+    def expire(self, key: str, seconds: int):
+        entry = self._live(key)
+        if entry is None:
+            return False
+        self._data[key] = (entry[0], self._clock() + seconds)
+        return True
+
+    def delete(self, key: str):
+        return 1 if self._data.pop(key, None) is not None else 0
+
+
+@pytest.fixture
+def fake_redis(clock):
+    return FakeRedis(clock)
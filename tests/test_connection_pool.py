@@ -0,0 +1,203 @@
+import threading
+import time
+
+import mysql.connector
+import pytest
+
+import db_helper
+from benchmark.sqlite_backend import SQLiteConnection
+
+
+class TrackedConnection(SQLiteConnection):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.pings = 0
+        self.dead = False
+        self.closed = False
+
+    def ping(self, **kwargs):
+        self.pings += 1
+        if self.dead:
+            raise mysql.connector.InterfaceError(msg="Lost connection to MySQL server")
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+
+@pytest.fixture
+def make_pool(sqlite_db):
+    pools = []
+
+    def make_pool(min_size=0, max_size=2):
+        pool = db_helper.ConnectionPool(min_size, max_size, connect=lambda **kwargs: TrackedConnection(sqlite_db))
+        pools.append(pool)
+        return pool
+
+    yield make_pool
+    for pool in pools:
+        pool.close()
+
+
+def acquire_in_thread(pool, timeout):
+    # Returns a function that joins the thread and gives (connection, seconds waited)
+    result = {}
+
+    def run():
+        started = time.monotonic()
+        result["cnx"] = pool.acquire(timeout)
+        result["waited"] = time.monotonic() - started
+
+    thread = threading.Thread(target=run)
+    thread.start()
+
+    def join():
+        thread.join(timeout + 1)
+        return result["cnx"], result["waited"]
+
+    return join
+
+
+def test_opens_min_size_up_front_and_grows_to_max(make_pool):
+    pool = make_pool(min_size=1, max_size=2)
+    assert (pool.size, pool.idle) == (1, 1)
+
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first is not second
+    assert (pool.size, pool.idle) == (2, 0)
+
+    started = time.monotonic()
+    with pytest.raises(db_helper.PoolExhaustedError):
+        pool.acquire(timeout=0.1)
+    assert time.monotonic() - started >= 0.1
+
+
+def test_released_connection_is_reused(make_pool):
+    pool = make_pool()
+    cnx = pool.acquire()
+    pool.release(cnx)
+    assert pool.acquire() is cnx
+    assert pool.size == 1
+
+
+def test_release_wakes_a_waiter(make_pool):
+    pool = make_pool(max_size=1)
+    cnx = pool.acquire()
+    join = acquire_in_thread(pool, timeout=3)
+    time.sleep(0.1)
+    pool.release(cnx)
+
+    waiter_cnx, waited = join()
+    assert waiter_cnx is cnx
+    assert waited < 1
+
+
+def test_discarding_a_broken_connection_wakes_a_waiter(make_pool):
+    pool = make_pool(max_size=1)
+    cnx = pool.acquire()
+    join = acquire_in_thread(pool, timeout=3)
+    time.sleep(0.1)
+    pool.release(cnx, broken=True)
+
+    waiter_cnx, waited = join()
+    assert cnx.closed
+    assert waiter_cnx is not cnx
+    assert waited < 1
+    assert pool.size == 1
+
+
+def test_failed_connect_frees_its_slot(make_pool, sqlite_db):
+    attempts = []
+
+    def connect(**kwargs):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise mysql.connector.InterfaceError(msg="Can't connect to MySQL server")
+        return TrackedConnection(sqlite_db)
+
+    pool = db_helper.ConnectionPool(0, 1, connect=connect)
+    with pytest.raises(mysql.connector.InterfaceError):
+        pool.acquire()
+    assert pool.size == 0
+    pool.release(pool.acquire())
+    assert (pool.size, pool.idle) == (1, 1)
+    pool.close()
+
+
+def test_only_stale_connections_are_pinged(make_pool, monkeypatch):
+    pool = make_pool()
+    cnx = pool.acquire()
+    pool.release(cnx)
+    assert pool.acquire() is cnx
+    assert cnx.pings == 0
+
+    pool.release(cnx)
+    monkeypatch.setattr(db_helper, "POOL_HEALTH_CHECK_INTERVAL", 0)
+    assert pool.acquire() is cnx
+    assert cnx.pings == 1
+
+
+def test_stale_connection_failing_its_ping_is_replaced(make_pool, monkeypatch):
+    pool = make_pool()
+    cnx = pool.acquire()
+    pool.release(cnx)
+    cnx.dead = True
+    monkeypatch.setattr(db_helper, "POOL_HEALTH_CHECK_INTERVAL", 0)
+
+    replacement = pool.acquire()
+    assert replacement is not cnx
+    assert cnx.closed
+    assert pool.size == 1
+
+
+def test_connection_is_discarded_after_a_database_error(make_pool):
+    pool = make_pool()
+    with pytest.raises(mysql.connector.DatabaseError):
+        with pool.connection() as cnx:
+            cnx.cursor().execute("SELECT * FROM no_such_table")
+    assert cnx.closed
+    assert (pool.size, pool.idle) == (0, 0)
+
+
+def test_other_errors_keep_the_connection(make_pool):
+    pool = make_pool()
+    with pytest.raises(KeyError):
+        with pool.connection() as cnx:
+            raise KeyError("not a database problem")
+    assert not cnx.closed
+    assert (pool.size, pool.idle) == (1, 1)
+
+
+def test_release_rolls_back_an_open_transaction(make_pool):
+    pool = make_pool(max_size=1)
+    with pool.connection() as cnx:
+        cnx.start_transaction()
+        cnx.cursor().execute("UPDATE order_tracking SET status = %s WHERE order_id = %s", ("delivered", 41))
+
+    with pool.connection() as cnx:
+        assert not cnx.in_transaction
+        cursor = cnx.cursor()
+        cursor.execute("SELECT status FROM order_tracking WHERE order_id = %s", (41,))
+        assert cursor.fetchone() == ("in transit",)
+
+
+def test_close_wakes_waiters(make_pool):
+    pool = make_pool(max_size=1)
+    cnx = pool.acquire()
+    errors = []
+
+    def wait():
+        try:
+            pool.acquire(timeout=3)
+        except db_helper.PoolExhaustedError as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    time.sleep(0.1)
+    pool.close()
+    thread.join(1)
+    assert not thread.is_alive() and errors
+    pool.release(cnx)
+    assert cnx.closed
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from fastapi.responses import JSONResponse
+
+import idempotency
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_repeats_get_the_stored_reply():
+    cache = idempotency.IdempotencyCache(max_entries=10, ttl=60)
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        return JSONResponse(content={"fulfillmentText": f"call {len(calls)}"})
+
+    async def scenario():
+        first = await cache.run("s1:r1", handler)
+        second = await cache.run("s1:r1", handler)
+        return first.body, second.body
+
+    first, second = run(scenario())
+    assert first == second == b'{"fulfillmentText":"call 1"}'
+    assert len(calls) == 1
+
+
+def test_concurrent_repeats_wait_for_the_first_call():
+    cache = idempotency.IdempotencyCache(max_entries=10, ttl=60)
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return JSONResponse(content={"fulfillmentText": "done"})
+
+    async def scenario():
+        return await asyncio.gather(*(cache.run("s1:r1", handler) for _ in range(5)))
+
+    replies = run(scenario())
+    assert len(calls) == 1
+    assert {reply.body for reply in replies} == {b'{"fulfillmentText":"done"}'}
+
+
+def test_shared_claim_outlives_a_slow_handler(fake_redis, clock, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 0.2)
+    store = idempotency.RedisIdempotencyStore(fake_redis, ttl=600)
+    other_worker = idempotency.IdempotencyCache(max_entries=10, ttl=600, shared=store)
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        return JSONResponse(content={"fulfillmentText": "duplicate"})
+
+    # One worker is still in a slow complete_order, well past the retry wait
+    assert store.claim("s1:r1")
+    clock.advance(60)
+
+    with pytest.raises(Exception) as raised:
+        run(other_worker.run("s1:r1", handler))
+    assert getattr(raised.value, "status_code", None) == 503
+    assert calls == []
+
+    # Once the first worker stores its reply, retries get it
+    store.store("s1:r1", idempotency.StoredResponse(200, b'{"fulfillmentText":"placed"}', "application/json"))
+    reply = run(other_worker.run("s1:r1", handler))
+    assert reply.body == b'{"fulfillmentText":"placed"}'
+    assert calls == []
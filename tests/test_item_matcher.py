@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+
+import pytest
+
+from item_matcher import ItemMatcher, edit_distance
+
+DISHES = (
+    "Roll", "Tikka", "Biryani", "Curry", "Kebab", "Momo", "Burger", "Wrap", "Pizza", "Soup",
+    "Salad", "Noodles", "Rice", "Sandwich", "Pakora", "Samosa", "Korma", "Masala", "Kathi Roll", "Fry",
+    "Lollipop", "Manchurian", "Chilli", "Tandoor", "Handi", "Kadai", "Pulao", "Frankie", "Cutlet", "Bowl",
+)
+
+
+@pytest.fixture
+def large_menu():
+    # 90 names sharing a few prefixes, so "chi", "pan", "veg", ... are dropped as common trigrams
+    items = [SimpleNamespace(name=f"{base} {dish}") for base in ("Chicken", "Paneer", "Veg") for dish in DISHES]
+    return ItemMatcher(items)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("chickn roll", "Chicken Roll"),
+    ("chicken tikaa", "Chicken Tikka"),
+    ("paneer tikak", "Paneer Tikka"),
+    ("veg biryni", "Veg Biryani"),
+])
+def test_typos_on_a_large_menu(large_menu, text, expected):
+    assert large_menu.match(text).name == expected
+
+
+def test_transposition_is_one_edit():
+    assert edit_distance("chicken tikak", "chicken tikka", 1) == 1
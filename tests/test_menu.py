@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+import mysql.connector
+import pytest
+
+import db_helper
+
+
+@pytest.fixture
+def menu(sqlite_db):
+    return db_helper.load_menu()
+
+
+def test_lookup_by_name_alias_and_plural(menu):
+    assert menu.lookup("Pav Bhaji").item_id == 1
+    assert menu.lookup("veg biryani").name == "Vegetable Biryani"
+    assert menu.lookup("samosas").name == "Samosa"
+    assert menu.lookup("burger") is None
+
+
+def test_failed_refresh_keeps_menu_and_backs_off(menu, monkeypatch):
+    calls = []
+
+    def failing_load():
+        calls.append(1)
+        raise mysql.connector.DatabaseError(msg="server has gone away")
+
+    now = [menu.loaded_at + db_helper.MENU_TTL_SECONDS + 1]
+    monkeypatch.setattr(db_helper, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setattr(db_helper, "load_menu", failing_load)
+    monkeypatch.setattr(db_helper, "_menu_retry_at", 0.0)
+
+    assert db_helper.get_menu() is menu
+    assert db_helper.get_menu() is menu
+    # The second call was served from the stale copy without trying MySQL again
+    assert len(calls) == 1
+
+    now[0] += db_helper.MENU_REFRESH_RETRY_SECONDS + 1
+    assert db_helper.get_menu() is menu
+    assert len(calls) == 2
@@ -0,0 +1,38 @@
+import db_helper
+import metrics
+
+
+def db_calls(function: str):
+    series = metrics.DB_CALL_SECONDS._series.get((function,))
+    return sum(series[0]) if series else 0
+
+
+def test_only_database_round_trips_are_counted(sqlite_db):
+    db_helper.load_menu()
+    menu_loads = db_calls("load_menu")
+    db_helper.get_menu()
+    # Served from the cached menu
+    assert db_calls("load_menu") == menu_loads
+
+    lookups = db_calls("get_order_status")
+    db_helper.get_order_status(40)
+    db_helper.get_order_status(40)
+    assert db_calls("get_order_status") == lookups + 1
+
+
+def test_order_id_blocks_are_counted(sqlite_db):
+    allocator = db_helper.OrderIdAllocator(db_helper.reserve_order_id_block, block_size=5)
+    reserved = db_calls("reserve_order_id_block")
+    for _ in range(11):
+        allocator.next_id()
+    assert db_calls("reserve_order_id_block") == reserved + 3
+
+
+def test_failed_calls_are_counted(sqlite_db):
+    errors = metrics.DB_CALL_ERRORS._values.get(("test_failure",), 0)
+    try:
+        with db_helper.get_pool().connection("test_failure") as cnx:
+            cnx.cursor().execute("SELECT * FROM no_such_table")
+    except Exception:
+        pass
+    assert metrics.DB_CALL_ERRORS._values[("test_failure",)] == errors + 1
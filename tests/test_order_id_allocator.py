@@ -0,0 +1,117 @@
+import multiprocessing
+import threading
+
+import db_helper
+from benchmark import sqlite_backend
+
+PROCESSES = 4
+THREADS = 8
+IDS_PER_THREAD = 50
+BLOCK_SIZE = 7
+
+
+def allocate_from_threads(allocator: db_helper.OrderIdAllocator, threads: int = THREADS):
+    ids = []
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def worker():
+        start.wait()
+        got = [allocator.next_id() for _ in range(IDS_PER_THREAD)]
+        with lock:
+            ids.extend(got)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return ids
+
+
+def allocate_in_process(path: str):
+    # Runs in a spawned worker process with its own pool and allocator, like a uvicorn worker
+    sqlite_backend._db_path = path
+    db_helper.init_pool(1, THREADS, connect=sqlite_backend.connect)
+    try:
+        return allocate_from_threads(db_helper.OrderIdAllocator(db_helper.reserve_order_id_block, BLOCK_SIZE))
+    finally:
+        db_helper.close_pool()
+
+
+def test_ids_are_unique_across_threads(sqlite_db):
+    allocator = db_helper.OrderIdAllocator(db_helper.reserve_order_id_block, BLOCK_SIZE)
+    ids = allocate_from_threads(allocator)
+
+    assert len(ids) == THREADS * IDS_PER_THREAD
+    assert len(set(ids)) == len(ids)
+    # Seeded after the orders already in the dump
+    assert min(ids) >= 42
+
+
+def test_ids_are_unique_across_processes_and_threads(sqlite_db):
+    db_helper.close_pool()
+    # spawn rather than fork, so no process inherits another's SQLite connections
+    with multiprocessing.get_context("spawn").Pool(PROCESSES) as pool:
+        results = pool.map(allocate_in_process, [sqlite_db] * PROCESSES)
+
+    ids = [order_id for result in results for order_id in result]
+    assert len(ids) == PROCESSES * THREADS * IDS_PER_THREAD
+    assert len(set(ids)) == len(ids)
+
+
+def test_forked_child_does_not_reuse_parent_block(monkeypatch):
+    blocks = iter([100, 200])
+    allocator = db_helper.OrderIdAllocator(lambda size: next(blocks), block_size=10)
+    assert allocator.next_id() == 100
+
+    # Pretend we are now in a child process that inherited the allocator
+    monkeypatch.setattr(db_helper.os, "getpid", lambda: -1)
+    assert allocator.next_id() == 200
+
+
+def wait_for_prefetch(allocator: db_helper.OrderIdAllocator):
+    for _ in range(500):
+        if not allocator._prefetching:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("prefetch did not finish")
+
+
+def test_prefetch_reserves_next_block_in_background():
+    blocks = iter([100, 200, 300])
+    callers = []
+
+    def reserve(size):
+        callers.append(threading.current_thread().name)
+        return next(blocks)
+
+    allocator = db_helper.OrderIdAllocator(reserve, block_size=10, prefetch=True)
+    ids = [allocator.next_id() for _ in range(5)]
+    wait_for_prefetch(allocator)
+
+    ids += [allocator.next_id() for _ in range(10)]
+    assert ids == list(range(100, 110)) + list(range(200, 205))
+    # Only the very first block was reserved on the caller's thread
+    assert callers[0] == threading.current_thread().name
+    assert set(callers[1:]) == {"order-id-prefetch"}
+
+
+def test_failed_prefetch_falls_back_to_reserving_on_demand():
+    attempts = []
+
+    def reserve(size):
+        attempts.append(size)
+        if len(attempts) == 2:
+            raise RuntimeError("database is down")
+        return len(attempts) * 100
+
+    allocator = db_helper.OrderIdAllocator(reserve, block_size=4, prefetch=True)
+    ids = [allocator.next_id() for _ in range(3)]
+    wait_for_prefetch(allocator)
+
+    ids.append(allocator.next_id())
+    ids.append(allocator.next_id())
+    assert ids[:4] == [100, 101, 102, 103]
+    # A fresh block, reserved either on demand or by the next prefetch
+    assert ids[4] in (300, 400)
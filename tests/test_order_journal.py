@@ -0,0 +1,145 @@
+from datetime import date
+from decimal import Decimal
+
+import mysql.connector
+import pytest
+
+import db_helper
+import main
+import order_journal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = order_journal.OrderJournal(str(tmp_path / "journal.sqlite3"))
+    yield journal
+    journal.close()
+
+
+@pytest.fixture
+def write_behind(sqlite_db, journal, monkeypatch):
+    db_helper.load_menu()
+    flusher = order_journal.JournalFlusher(journal)
+    monkeypatch.setattr(main, "pending_orders", journal)
+    monkeypatch.setattr(main, "journal_flusher", flusher)
+    return flusher
+
+
+def test_order_is_journaled_then_flushed(write_behind, journal):
+    order_id, total = main.save_to_journal({3: 2, 9: 1})
+    assert total == 21
+    assert journal.is_pending(order_id)
+    assert main.track_order({"order_id": order_id}).body.decode().endswith('is: received"}')
+
+    assert write_behind.flush_once() == 1
+    assert not journal.is_pending(order_id)
+    assert db_helper.get_order_status(order_id) == "in progress"
+
+
+def test_order_id_failure_gets_backend_error_reply(write_behind, journal, monkeypatch):
+    def unavailable():
+        raise db_helper.PoolExhaustedError("No database connection available after 5s")
+
+    monkeypatch.setattr(db_helper, "get_next_order_id", unavailable)
+    assert main.save_to_journal({3: 1}) == (-1, None)
+    assert len(journal) == 0
+
+
+def test_stop_reports_whether_the_thread_exited(journal):
+    flusher = order_journal.JournalFlusher(journal, interval=0.01)
+    flusher.start()
+    assert flusher.stop(timeout=5)
+
+
+def sales_on(day):
+    with db_helper.get_pool().connection() as cnx:
+        cursor = cnx.cursor()
+        cursor.execute("SELECT order_count, item_count FROM sales_daily WHERE sale_date = %s", (day,))
+        row = cursor.fetchone()
+        cursor.close()
+    return row
+
+
+def test_replayed_orders_are_counted_once(sqlite_db):
+    day = date(2024, 6, 1)
+    first = (9001, {1: (2, 6)})
+    second = (9002, {2: (1, 7)})
+
+    db_helper.insert_orders([first], ignore_existing=True, sale_dates={9001: day})
+    # A batch flushed again after a crash, with one order that didn't make it the first time
+    db_helper.insert_orders([first, second], ignore_existing=True, sale_dates={9001: day, 9002: day})
+    db_helper.fold_sales_rollups()
+    assert sales_on(day) == (2, 3)
+    assert db_helper.get_order_status(9002) == "in progress"
+
+
+class StaleReadCursor:
+    # Misses rows stored by someone else after the consistent read, like a concurrent flusher's
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._stale = True
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if self._stale:
+            self._stale = False
+            return []
+        return rows
+
+
+def test_orders_stored_concurrently_are_not_claimed(sqlite_db):
+    db_helper.insert_orders([(9001, {1: (2, 6)})])
+    orders = [(9001, {1: (2, 6)}), (9002, {2: (1, 7)})]
+    with db_helper.get_pool().connection() as cnx:
+        cursor = StaleReadCursor(cnx.cursor())
+        cnx.start_transaction()
+        assert db_helper._insert_new_tracking_rows(cnx, cursor, orders, "in progress") == orders[1:]
+        cnx.rollback()
+
+
+@pytest.fixture
+def rejects_item_9(monkeypatch):
+    # Stands in for the orders_ibfk_1 foreign key failing on an item deleted from food_items
+    insert_orders = db_helper.insert_orders
+
+    def insert_checking_items(orders, *args, **kwargs):
+        if any(9 in lines for _, lines in orders):
+            raise mysql.connector.IntegrityError(msg="Cannot add or update a child row: a foreign key constraint fails")
+        return insert_orders(orders, *args, **kwargs)
+
+    monkeypatch.setattr(db_helper, "insert_orders", insert_checking_items)
+
+
+def test_rejected_order_does_not_block_the_queue(sqlite_db, journal, rejects_item_9):
+    flusher = order_journal.JournalFlusher(journal, max_attempts=2)
+    journal.append(9001, {1: (1, Decimal("6"))})
+    journal.append(9002, {9: (1, Decimal("5"))})
+    journal.append(9003, {2: (2, Decimal("7"))})
+
+    assert flusher.flush_once() == 2
+    assert db_helper.get_order_status(9003) == "in progress"
+    assert journal.status(9002) == order_journal.RECEIVED_STATUS
+
+    assert flusher.flush_once() == 0
+    assert len(journal) == 0
+    assert journal.failed_count() == 1
+    assert journal.status(9002) == order_journal.FAILED_STATUS
+    assert db_helper.get_order_status(9002) is None
+
+
+def test_outage_is_retried_without_giving_up_on_orders(sqlite_db, journal, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise mysql.connector.OperationalError(msg="Lost connection to MySQL server during query")
+
+    monkeypatch.setattr(db_helper, "insert_orders", unavailable)
+    flusher = order_journal.JournalFlusher(journal, max_attempts=1)
+    journal.append(9001, {1: (1, Decimal("6"))})
+
+    for _ in range(3):
+        with pytest.raises(mysql.connector.OperationalError):
+            flusher.flush_once()
+    assert journal.status(9001) == order_journal.RECEIVED_STATUS
+    assert journal.failed_count() == 0
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import threading
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import db_helper
+import main
+import order_events
+
+
+def updates_body(*updates):
+    return json.dumps({"updates": list(updates)}).encode()
+
+
+def test_parse_status_updates():
+    body = updates_body({"order_id": 41, "status": "delivered"}, {"order_id": 42, "status": "in transit"})
+    assert main.parse_status_updates(body) == [(41, "delivered"), (42, "in transit")]
+
+
+@pytest.mark.parametrize("body", [
+    b"not json",
+    b'{"updates": {"order_id": 41}}',
+    updates_body({"order_id": 41}),
+    updates_body({"order_id": 41, "status": ["delivered"]}),
+    updates_body({"order_id": 41, "status": None}),
+    updates_body({"order_id": True, "status": "delivered"}),
+    updates_body({"order_id": 41.5, "status": "delivered"}),
+    updates_body({"order_id": "41", "status": "delivered"}),
+])
+def test_malformed_status_updates_are_rejected(body):
+    with pytest.raises(HTTPException) as raised:
+        main.parse_status_updates(body)
+    assert raised.value.status_code == 400
+
+
+@pytest.fixture
+def orders(sqlite_db):
+    # 40 is delivered and 41 in transit in the sample data
+    db_helper.insert_orders([(order_id, {1: (1, Decimal("6"))}) for order_id in (9001, 9002, 9003, 9004, 9005)])
+
+
+def stored_status(order_id: int):
+    with db_helper.get_pool().connection() as cnx:
+        cursor = cnx.cursor()
+        cursor.execute("SELECT status FROM order_tracking WHERE order_id = %s", (order_id,))
+        row = cursor.fetchone()
+        cursor.close()
+    return row[0] if row else None
+
+
+def test_allowed_changes_are_applied(orders):
+    changes, rejected = db_helper.update_order_statuses([(9001, "in transit"), (41, "delivered"), (9002, "cancelled")])
+    assert changes == [(9001, "in progress", "in transit"), (41, "in transit", "delivered"), (9002, "in progress", "cancelled")]
+    assert rejected == []
+    assert [stored_status(order_id) for order_id in (9001, 41, 9002)] == ["in transit", "delivered", "cancelled"]
+
+
+def test_disallowed_changes_are_rejected_and_the_rest_applied(orders):
+    changes, rejected = db_helper.update_order_statuses([
+        (41, "in progress"),
+        (40, "cancelled"),
+        (9001, "lost"),
+        (9999, "delivered"),
+        (9002, "delivered"),
+    ])
+    assert changes == [(9002, "in progress", "delivered")]
+    assert rejected == [
+        (41, "in progress", "cannot change status from 'in transit' to 'in progress'"),
+        (40, "cancelled", "cannot change status from 'delivered' to 'cancelled'"),
+        (9001, "lost", "unknown status 'lost'"),
+        (9999, "delivered", "no such order"),
+    ]
+    assert [stored_status(order_id) for order_id in (41, 40, 9001, 9999)] == ["in transit", "delivered", "in progress", None]
+
+
+def test_repeating_the_current_status_is_a_no_op(orders):
+    assert db_helper.update_order_statuses([(41, "in transit"), (40, "delivered")]) == ([], [])
+
+
+def test_updates_to_one_order_apply_in_turn(orders):
+    changes, rejected = db_helper.update_order_statuses([
+        (9001, "in transit"), (9001, "delivered"), (9001, "in transit"), (9001, "delivered"),
+    ])
+    assert changes == [(9001, "in progress", "in transit"), (9001, "in transit", "delivered")]
+    assert rejected == [(9001, "in transit", "cannot change status from 'delivered' to 'in transit'")]
+    assert stored_status(9001) == "delivered"
+
+
+def test_batches_larger_than_a_chunk(orders, monkeypatch):
+    monkeypatch.setattr(db_helper, "STATUS_UPDATE_CHUNK_SIZE", 2)
+    order_ids = [9005, 9003, 9001, 9004, 9002]
+    changes, rejected = db_helper.update_order_statuses([(order_id, "in transit") for order_id in order_ids])
+    assert [order_id for order_id, _, _ in changes] == order_ids
+    assert rejected == []
+    assert {stored_status(order_id) for order_id in order_ids} == {"in transit"}
+
+
+def test_changes_are_written_through_to_the_cache(orders, monkeypatch):
+    assert db_helper.get_order_status(9001) == "in progress"
+    db_helper.update_order_statuses([(9001, "delivered")])
+
+    def unavailable():
+        raise AssertionError("status should come from the cache")
+
+    monkeypatch.setattr(db_helper, "get_pool", unavailable)
+    assert db_helper.get_order_status(9001) == "delivered"
+
+
+def test_endpoint_applies_and_publishes(orders, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_API_TOKEN", "secret")
+    published = []
+    monkeypatch.setattr(main.status_events, "publish", published.extend)
+    client = TestClient(main.app, headers={"Authorization": "Bearer secret"})
+
+    response = client.post("/orders/status", content=updates_body(
+        {"order_id": 9001, "status": "in transit"},
+        {"order_id": 41, "status": "in transit"},
+        {"order_id": 40, "status": "cancelled"},
+    ))
+    assert response.status_code == 200
+    assert response.json() == {
+        "updated": 1,
+        "unchanged": 1,
+        "rejected": [{"order_id": 40, "status": "cancelled", "reason": "cannot change status from 'delivered' to 'cancelled'"}],
+    }
+    assert [(event["order_id"], event["previous_status"], event["status"]) for event in published] == [
+        (9001, "in progress", "in transit")
+    ]
+
+
+def event(order_id: int, status: str = "delivered"):
+    return {"order_id": order_id, "status": status}
+
+
+def test_events_reach_matching_subscribers():
+    async def scenario():
+        bus = order_events.OrderEventBus()
+        everything = bus.subscribe()
+        only_41 = bus.subscribe([41])
+
+        # Published from another thread, like the DB executor
+        publisher = threading.Thread(target=bus.publish, args=([event(40), event(41)],))
+        publisher.start()
+        publisher.join()
+
+        assert await everything.get(1) == [event(40), event(41)]
+        assert await only_41.get(1) == [event(41)]
+        assert await only_41.get(0.01) == []
+        assert bus.published == 2
+
+        only_41.close()
+        everything.close()
+        assert len(bus) == 0
+
+    asyncio.run(scenario())
+
+
+def test_subscriber_falling_behind_overflows():
+    async def scenario():
+        bus = order_events.OrderEventBus(max_pending=2)
+        slow = bus.subscribe()
+        fast = bus.subscribe()
+
+        bus.publish([event(1)])
+        await asyncio.sleep(0)
+        assert await fast.get(1) == [event(1)]
+        bus.publish([event(2), event(3)])
+        await asyncio.sleep(0)
+
+        with pytest.raises(order_events.SubscriberOverflow):
+            await slow.get(1)
+        # Other subscribers aren't affected
+        assert await fast.get(1) == [event(2), event(3)]
+
+    asyncio.run(scenario())
+
+
+def test_subscribers_on_a_closed_loop_are_dropped():
+    bus = order_events.OrderEventBus()
+
+    async def subscribe():
+        return bus.subscribe()
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(subscribe())
+    loop.close()
+
+    bus.publish([event(1)])
+    assert len(bus) == 0
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+import db_helper
+import main
+import session_store
+
+
+@pytest.fixture
+def menu(sqlite_db, monkeypatch):
+    monkeypatch.setattr(main, "inprogress_orders", session_store.MemorySessionStore())
+    return db_helper.load_menu()
+
+
+def query(sql: str, params=()):
+    with db_helper.get_pool().connection() as cnx:
+        cursor = cnx.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows
+
+
+def stored(order_id: int):
+    # (order rows, tracking rows, sales_pending rows) of one order
+    return (
+        query("SELECT item_id, quantity, total_price FROM orders WHERE order_id = %s ORDER BY item_id", (order_id,)),
+        query("SELECT status FROM order_tracking WHERE order_id = %s", (order_id,)),
+        query("SELECT item_id, quantity, revenue FROM sales_pending WHERE order_id = %s ORDER BY item_id", (order_id,)),
+    )
+
+
+def test_order_is_priced_from_the_menu_and_stored(menu):
+    # Pav Bhaji (1) is 6.00, Mango Lassi (4) 5.00
+    total = db_helper.insert_order(9001, {1: 2, 4: 1})
+    assert total == 17
+    assert stored(9001) == (
+        [(1, 2, 12), (4, 1, 5)],
+        [("in progress",)],
+        [(1, 2, 12), (4, 1, 5)],
+    )
+    assert db_helper.get_order_status(9001) == "in progress"
+
+
+def test_spellings_of_one_item_are_merged_into_one_line(menu):
+    reply = main.add_to_order({"food-item": ["Pav Bhaji", "pav bhajis", "pao bhaji"], "number": [1, 2, 1]}, "s1", True)
+    assert json.loads(reply.body)["fulfillmentText"] == "So far you have: 4 Pav Bhaji. Do you need anything else?"
+    assert main.inprogress_orders.get("s1") == {1: 4}
+
+    main.complete_order({}, "s1")
+    order_id = query("SELECT MAX(order_id) FROM order_tracking")[0][0]
+    assert stored(order_id)[0] == [(1, 4, 24)]
+
+
+def test_removing_an_item_by_another_spelling(menu):
+    main.add_to_order({"food-item": ["Pizza", "Samosa"], "number": [2, 1]}, "s1", True)
+    reply = main.remove_from_order({"food-item": ["pizzas", "Burger"]}, "s1")
+    assert json.loads(reply.body)["fulfillmentText"] == (
+        "Removed Pizza from your order! Your current order does not have Burger. Here is what’s left in your order: 1 Samosa"
+    )
+    assert main.inprogress_orders.get("s1") == {9: 1}
+
+
+def test_order_with_an_item_gone_from_the_menu_is_rejected_whole(menu):
+    assert db_helper.insert_order(9001, {1: 2, 99: 1}) == -1
+    assert stored(9001) == ([], [], [])
+    assert db_helper.get_order_status(9001) is None
+
+
+def test_empty_order_is_rejected(menu):
+    assert db_helper.insert_order(9001, {}) == -1
+    assert stored(9001) == ([], [], [])
+
+
+def test_failed_write_leaves_no_rows_behind(menu):
+    # Order 41 already has a tracking row, so its insert fails after nothing else was written
+    before = stored(41)
+    assert db_helper.insert_order(41, {3: 3}) == -1
+    assert stored(41) == before
+
+
+def test_save_to_db_allocates_an_id(menu):
+    order_id, total = main.save_to_db({9: 2})
+    assert total == 10
+    assert order_id > 41
+    assert stored(order_id)[0] == [(9, 2, 10)]
+
+
+def test_save_to_db_reports_a_rejected_order(menu):
+    assert main.save_to_db({99: 1}) == (-1, None)
@@ -0,0 +1,195 @@
+import csv
+import io
+import json
+import time
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+
+import db_helper
+import main
+import reporting
+
+JUNE_1, JUNE_2, JUNE_3 = date(2024, 6, 1), date(2024, 6, 2), date(2024, 6, 3)
+ORDERS = [
+    # (order_id, {item_id: (quantity, price)}, sale_date)
+    (9001, {1: (2, Decimal("6")), 3: (1, Decimal("8"))}, JUNE_1),
+    (9002, {3: (2, Decimal("8"))}, JUNE_1),
+    (9003, {9: (4, Decimal("5"))}, JUNE_2),
+    (9004, {1: (1, Decimal("6"))}, JUNE_3),
+]
+# (date, orders, items, revenue, average basket)
+DAILY = [
+    ("2024-06-01", 2, 5, 36, 18),
+    ("2024-06-02", 1, 4, 20, 20),
+    ("2024-06-03", 1, 1, 6, 6),
+]
+
+
+def insert_sales():
+    db_helper.insert_orders(
+        [(order_id, lines) for order_id, lines, _ in ORDERS],
+        sale_dates={order_id: sale_date for order_id, _, sale_date in ORDERS}
+    )
+
+
+def normalized(rows):
+    # SQLite hands dates back as strings and DECIMAL columns as floats
+    return [tuple(str(value) if isinstance(value, date) else value for value in row) for row in rows]
+
+
+@pytest.fixture
+def sales(sqlite_db):
+    db_helper.load_menu()
+    insert_sales()
+    db_helper.fold_sales_rollups()
+
+
+def test_orders_reach_the_rollups_when_folded(sqlite_db):
+    insert_sales()
+    assert reporting.daily_sales() == ([], None)
+
+    assert db_helper.fold_sales_rollups() == 4
+    assert db_helper.fold_sales_rollups() == 0
+    rows, _ = reporting.daily_sales()
+    assert normalized(rows) == DAILY
+
+
+def test_small_fold_batches_count_each_order_once(sqlite_db):
+    # A batch of 3 lines ends partway through the orders, 9001 alone has 2 lines
+    insert_sales()
+    while db_helper.fold_sales_rollups(limit=3):
+        pass
+    rows, _ = reporting.daily_sales()
+    assert normalized(rows) == DAILY
+
+
+def test_folder_thread_keeps_the_rollups_up_to_date(sqlite_db):
+    folder = reporting.RollupFolder(interval=0.01)
+    folder.start()
+    try:
+        insert_sales()
+        deadline = time.monotonic() + 5
+        while reporting.daily_sales() == ([], None) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        assert folder.stop(timeout=5)
+    rows, _ = reporting.daily_sales()
+    assert normalized(rows) == DAILY
+
+
+def test_daily_sales_pages(sales):
+    first, cursor = reporting.daily_sales(limit=2)
+    assert normalized(first) == DAILY[:2]
+    assert cursor == "2024-06-02"
+
+    second, cursor = reporting.daily_sales(after=cursor, limit=2)
+    assert normalized(second) == DAILY[2:]
+    assert cursor is None
+
+
+def test_item_sales_pages_cover_every_row_once(sales):
+    everything, cursor = reporting.item_sales()
+    assert cursor is None
+    assert normalized(everything) == [
+        ("2024-06-01", 1, "Pav Bhaji", 1, 2, 12),
+        ("2024-06-01", 3, "Pizza", 2, 3, 24),
+        ("2024-06-02", 9, "Samosa", 1, 4, 20),
+        ("2024-06-03", 1, "Pav Bhaji", 1, 1, 6),
+    ]
+
+    pages = []
+    cursor = None
+    while True:
+        rows, cursor = reporting.item_sales(after=cursor, limit=1)
+        pages.extend(rows)
+        if cursor is None:
+            break
+    assert pages == everything
+
+
+def test_date_filters(sales):
+    rows, _ = reporting.daily_sales(start=JUNE_2, end=JUNE_2)
+    assert normalized(rows) == DAILY[1:2]
+
+    rows, _ = reporting.item_sales(start=JUNE_2)
+    assert [row[1] for row in rows] == [9, 1]
+
+
+def test_top_items(sales):
+    rows, cursor = reporting.top_items()
+    # Ties on quantity are ranked by item_id
+    assert rows == [
+        (1, 9, "Samosa", 1, 4, 20),
+        (2, 1, "Pav Bhaji", 2, 3, 18),
+        (3, 3, "Pizza", 2, 3, 24),
+    ]
+    assert cursor is None
+
+    rows, _ = reporting.top_items(start=JUNE_3)
+    assert rows == [(1, 1, "Pav Bhaji", 1, 1, 6)]
+
+
+def test_encoders_round_trip_across_chunks():
+    columns = ("date", "item_id", "revenue")
+    rows = [(JUNE_1, item_id, Decimal("1.50")) for item_id in range(450)]
+
+    decoded = json.loads("".join(reporting.encode_json(columns, rows, "2024-06-01,449")))
+    assert decoded["columns"] == list(columns)
+    assert len(decoded["rows"]) == 450
+    assert decoded["rows"][449] == {"date": "2024-06-01", "item_id": 449, "revenue": 1.5}
+    assert decoded["next_cursor"] == "2024-06-01,449"
+
+    lines = list(csv.reader(io.StringIO("".join(reporting.encode_csv(columns, rows)))))
+    assert lines[0] == list(columns)
+    assert len(lines) == 451
+    assert lines[450] == ["2024-06-01", "449", "1.50"]
+
+
+@pytest.fixture
+def client(sales, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_API_TOKEN", "secret")
+    return TestClient(main.app, headers={"Authorization": "Bearer secret"})
+
+
+def test_report_endpoint_json_pages(client):
+    response = client.get("/reports/daily", params={"limit": 2})
+    assert response.status_code == 200
+    assert response.headers["X-Next-Cursor"] == "2024-06-02"
+    body = response.json()
+    assert body["next_cursor"] == "2024-06-02"
+    assert [row["date"] for row in body["rows"]] == ["2024-06-01", "2024-06-02"]
+
+    response = client.get("/reports/daily", params={"limit": 2, "after": body["next_cursor"]})
+    assert "X-Next-Cursor" not in response.headers
+    assert response.json()["next_cursor"] is None
+    assert [row["date"] for row in response.json()["rows"]] == ["2024-06-03"]
+
+
+def test_report_endpoint_csv(client):
+    response = client.get("/reports/items", params={"format": "csv", "from": "2024-06-02", "to": "2024-06-03"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    header, *rows = csv.reader(io.StringIO(response.text))
+    assert header == ["date", "item_id", "name", "orders", "quantity", "revenue"]
+    assert [(*row[:5], float(row[5])) for row in rows] == [
+        ("2024-06-02", "9", "Samosa", "1", "4", 20),
+        ("2024-06-03", "1", "Pav Bhaji", "1", "1", 6),
+    ]
+
+
+@pytest.mark.parametrize("path, params, status", [
+    ("/reports/weekly", {}, 404),
+    ("/reports/daily", {"from": "June"}, 400),
+    ("/reports/daily", {"limit": 0}, 400),
+    ("/reports/daily", {"format": "xml"}, 400),
+    ("/reports/items", {"after": "not-a-cursor"}, 400),
+])
+def test_report_endpoint_rejects_bad_requests(client, path, params, status):
+    assert client.get(path, params=params).status_code == status
+
+
+def test_report_endpoint_needs_the_token(client):
+    assert client.get("/reports/daily", headers={"Authorization": "Bearer wrong"}).status_code == 401
@@ -0,0 +1,109 @@
+import sys
+
+import pytest
+
+import session_store
+
+
+def test_session_store_is_abstract():
+    with pytest.raises(TypeError):
+        session_store.SessionStore()
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, clock, fake_redis):
+    if request.param == "memory":
+        return session_store.MemorySessionStore(max_entries=100, ttl=60)
+    return session_store.RedisSessionStore(fake_redis, ttl=60)
+
+
+def test_set_get_delete(store):
+    assert store.get("s1") is None
+
+    store.set("s1", {3: 2})
+    assert store.get("s1") == {3: 2}
+
+    store.delete("s1")
+    assert store.get("s1") is None
+    # Deleting a missing session is not an error
+    store.delete("s1")
+
+
+def test_changes_need_set_to_be_stored(store):
+    store.set("s1", {3: 2})
+    cart = store.get("s1")
+    cart[9] = 1
+    assert store.get("s1") == {3: 2}
+
+    store.set("s1", cart)
+    assert store.get("s1") == {3: 2, 9: 1}
+
+
+def test_sessions_expire(store, clock):
+    store.set("s1", {3: 2})
+    clock.advance(59)
+    assert store.get("s1") == {3: 2}
+
+    store.set("s1", {3: 3})
+    clock.advance(59)
+    # Setting the cart again restarted its TTL
+    assert store.get("s1") == {3: 3}
+
+    clock.advance(61)
+    assert store.get("s1") is None
+
+
+def test_memory_store_evicts_least_recently_used(clock):
+    store = session_store.MemorySessionStore(max_entries=2, ttl=60)
+    store.set("s1", {3: 1})
+    store.set("s2", {3: 2})
+    # Reading s1 makes s2 the least recently used
+    store.get("s1")
+    store.set("s3", {3: 3})
+
+    assert store.get("s2") is None
+    assert store.get("s1") == {3: 1}
+    assert store.get("s3") == {3: 3}
+    assert len(store) == 2
+
+
+def test_redis_store_shares_carts_between_workers(fake_redis):
+    worker_a = session_store.RedisSessionStore(fake_redis)
+    worker_b = session_store.RedisSessionStore(fake_redis)
+
+    worker_a.set("s1", {5: 1})
+    assert worker_b.get("s1") == {5: 1}
+
+    worker_b.delete("s1")
+    assert worker_a.get("s1") is None
+
+
+def test_redis_store_ignores_carts_keyed_by_name(fake_redis):
+    fake_redis.set("cart:s1", '{"Masala Dosa": 1}')
+    assert session_store.RedisSessionStore(fake_redis).get("s1") is None
+
+
+def test_create_session_store():
+    assert isinstance(session_store.create_session_store("memory"), session_store.MemorySessionStore)
+    with pytest.raises(ValueError):
+        session_store.create_session_store("memcached")
+
+
+def test_redis_backends_share_one_client(fake_redis, monkeypatch):
+    import idempotency
+
+    monkeypatch.setattr(session_store, "_redis_client", fake_redis)
+    session_store.create_session_store("redis").set("s1", {3: 1})
+    replies = idempotency.create_idempotency_cache("redis")
+    replies._shared.store("k1", idempotency.StoredResponse(200, b"{}", "application/json"))
+
+    assert fake_redis.get("cart:s1") is not None
+    assert fake_redis.get("webhook:k1") is not None
+
+
+def test_redis_backend_without_the_package(monkeypatch):
+    monkeypatch.setattr(session_store, "_redis_client", None)
+    # None in sys.modules makes the import fail
+    monkeypatch.setitem(sys.modules, "redis", None)
+    with pytest.raises(RuntimeError, match="IDEMPOTENCY_BACKEND=redis"):
+        session_store.get_redis_client("IDEMPOTENCY_BACKEND")
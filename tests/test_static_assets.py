@@ -0,0 +1,163 @@
+import gzip
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import main
+import static_assets
+
+STYLES = b"body { color: #333; }\n" * 50
+PAGE = """<html><head>
+<link rel="stylesheet" href="styles.css">
+<link href="https://fonts.example.com/css?family=Roboto" rel="stylesheet">
+</head><body>
+<a href="#menu">MENU</a>
+<img src="banner.png">
+</body></html>"""
+
+
+@pytest.fixture
+def frontend_dir(tmp_path):
+    (tmp_path / "home.html").write_text(PAGE)
+    (tmp_path / "styles.css").write_bytes(STYLES)
+    (tmp_path / "banner.png").write_bytes(bytes(range(256)) * 4)
+    return tmp_path
+
+
+@pytest.fixture
+def assets(frontend_dir):
+    return static_assets.StaticAssets(str(frontend_dir))
+
+
+def request(**headers):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def styles(assets):
+    return assets.get(assets.urls["styles.css"][len(static_assets.STATIC_URL_PREFIX):])
+
+
+def test_page_links_to_fingerprinted_urls(assets):
+    html = assets.index.variants["identity"].decode()
+    styles_url = assets.urls["styles.css"]
+    assert styles_url.startswith("/static/styles.") and styles_url.endswith(".css")
+    assert f'href="{styles_url}"' in html
+    assert f'src="{assets.urls["banner.png"]}"' in html
+    # External links and fragments are left alone
+    assert 'href="https://fonts.example.com/css?family=Roboto"' in html
+    assert 'href="#menu"' in html
+
+
+def test_fingerprint_follows_the_content(frontend_dir, assets):
+    (frontend_dir / "styles.css").write_bytes(STYLES + b"a { color: red; }\n")
+    assert static_assets.StaticAssets(str(frontend_dir)).urls["styles.css"] != assets.urls["styles.css"]
+
+
+def test_served_through_the_app(assets, monkeypatch):
+    monkeypatch.setattr(main, "frontend", assets)
+    client = TestClient(main.app)
+
+    page = client.get("/")
+    assert page.status_code == 200
+    assert page.headers["cache-control"] == static_assets.PAGE_CACHE_CONTROL
+    assert assets.urls["styles.css"] in page.text
+
+    response = client.get(assets.urls["styles.css"])
+    assert response.status_code == 200
+    assert response.content == STYLES
+    assert response.headers["cache-control"] == static_assets.IMMUTABLE_CACHE_CONTROL
+    assert response.headers["content-type"].startswith("text/css")
+
+    assert client.get("/static/styles.css").status_code == 404
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("", "identity"),
+    ("gzip, deflate", "gzip"),
+    ("deflate", "identity"),
+])
+def test_encoding_follows_accept_encoding(assets, accept_encoding, expected):
+    asset = styles(assets)
+    response = static_assets.serve_asset(asset, request(accept_encoding=accept_encoding))
+    assert response.headers.get("content-encoding", "identity") == expected
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == asset.etag(expected)
+    body = response.body if expected == "identity" else gzip.decompress(response.body)
+    assert body == STYLES
+
+
+def test_brotli_is_preferred_when_available(frontend_dir, monkeypatch):
+    # A stand-in compressor, only the choice of variant is under test
+    monkeypatch.setattr(static_assets, "brotli", SimpleNamespace(compress=lambda body, quality: b"br" + body[:10]))
+    asset = styles(static_assets.StaticAssets(str(frontend_dir)))
+    assert static_assets.serve_asset(asset, request(accept_encoding="gzip, br")).headers["content-encoding"] == "br"
+    assert static_assets.serve_asset(asset, request(accept_encoding="gzip")).headers["content-encoding"] == "gzip"
+
+
+def test_images_are_not_compressed(assets):
+    image = assets.get(assets.urls["banner.png"][len(static_assets.STATIC_URL_PREFIX):])
+    assert list(image.variants) == ["identity"]
+    assert "content-encoding" not in static_assets.serve_asset(image, request(accept_encoding="gzip")).headers
+
+
+def test_if_none_match(assets):
+    asset = styles(assets)
+    gzip_etag = asset.etag("gzip")
+
+    response = static_assets.serve_asset(asset, request(accept_encoding="gzip", if_none_match=gzip_etag))
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == gzip_etag
+
+    assert static_assets.serve_asset(asset, request(accept_encoding="gzip", if_none_match=f'"other", {gzip_etag}')).status_code == 304
+    assert static_assets.serve_asset(asset, request(accept_encoding="gzip", if_none_match="*")).status_code == 304
+    # The uncompressed variant has its own ETag
+    assert static_assets.serve_asset(asset, request(if_none_match=gzip_etag)).status_code == 200
+
+
+@pytest.mark.parametrize("range_header, start, end", [
+    ("bytes=0-9", 0, 9),
+    ("bytes=10-", 10, len(STYLES) - 1),
+    ("bytes=-5", len(STYLES) - 5, len(STYLES) - 1),
+    ("bytes=100-99999", 100, len(STYLES) - 1),
+])
+def test_range_requests(assets, range_header, start, end):
+    # Ranges are served from the uncompressed body even when gzip is accepted
+    response = static_assets.serve_asset(styles(assets), request(accept_encoding="gzip", range=range_header))
+    assert response.status_code == 206
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{len(STYLES)}"
+    assert response.body == STYLES[start:end + 1]
+
+
+def test_unsatisfiable_range(assets):
+    response = static_assets.serve_asset(styles(assets), request(range=f"bytes={len(STYLES)}-"))
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(STYLES)}"
+
+
+@pytest.mark.parametrize("range_header", ["bytes=0-1,5-9", "bytes=-", "items=0-9"])
+def test_unsupported_ranges_get_the_whole_body(assets, range_header):
+    response = static_assets.serve_asset(styles(assets), request(range=range_header))
+    assert response.status_code == 200
+    assert response.body == STYLES
+
+
+def test_if_range(assets):
+    asset = styles(assets)
+    response = static_assets.serve_asset(asset, request(range="bytes=0-9", if_range=asset.etag("identity")))
+    assert response.status_code == 206
+    assert response.body == STYLES[:10]
+
+    # A stale validator means the client's partial copy is outdated, send the whole (compressed) body
+    response = static_assets.serve_asset(asset, request(accept_encoding="gzip", range="bytes=0-9", if_range='"stale"'))
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(response.body) == STYLES